@@ -0,0 +1,78 @@
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+class ApiCache:
+    """API 响应的本地缓存，基于 SQLite
+
+    以 (接口名, 参数) 为键保存 JSON 响应，超过 ttl 秒的条目视为过期；
+    总大小超过 max_bytes 时按最近访问时间淘汰（LRU）。
+    """
+
+    def __init__(self, path, ttl=1800, max_bytes=64 * 1024 * 1024):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT, size INTEGER, created_at REAL, accessed_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(method, args, kwargs):
+        return json.dumps([method, list(args), kwargs], sort_keys=True, default=str, ensure_ascii=False)
+
+    def get(self, key):
+        """返回未过期的缓存响应，未命中时返回 None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        data = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                               (key, data, len(data), now, now))
+            self._evict_locked(now)
+            self._conn.commit()
+
+    def _evict_locked(self, now):
+        self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall()
+        expired = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            expired.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", expired)
+
+    def stats_text(self):
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0
+        return f"API缓存: 命中 {self.hits} 次, 未命中 {self.misses} 次 (命中率 {rate:.0f}%)"
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
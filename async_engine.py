@@ -0,0 +1,339 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from cancel import DownloadCancelled
+from pixiv_downloader import (IMAGE_HEADERS, RETRY_STATUS, THROTTLE_STATUS, IncompleteDownload, parse_retry_after,
+                              retry_delay)
+
+
+_END = object()
+
+
+def _retry_info(error):
+    """aiohttp 版本的可重试判断，返回 (是否可重试, Retry-After 秒数)"""
+    if isinstance(error, aiohttp.ClientResponseError):
+        retry_after = parse_retry_after(error.headers.get('Retry-After')) if error.headers else None
+        return error.status in RETRY_STATUS, retry_after
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError, IncompleteDownload)), None
+
+
+class AsyncDownloadEngine:
+    """asyncio 下载引擎，与 PixivDownloader 的线程池下载方式二选一
+
+    图片请求在同一个事件循环线程中以有限并发同时进行；pixivpy3 是同步库，
+    元数据遍历器（以及其中的 API 调用）放在默认线程池中执行。
+    文件命名、断点续传、限速和下载记录与线程池方式保持一致。
+    """
+
+    def __init__(self, downloader, concurrency=None):
+        if aiohttp is None:
+            raise RuntimeError("asyncio 下载引擎需要 aiohttp，请先运行: pip install aiohttp")
+        self.downloader = downloader
+        self.concurrency = concurrency or downloader.download_workers * 4
+
+    def run(self, illusts, limit, progress_callback=None):
+        """消费元数据遍历器，返回成功下载的作品数"""
+        return asyncio.run(self._run(iter(illusts), limit, progress_callback))
+
+    async def _run(self, illusts, limit, progress_callback):
+        loop = asyncio.get_running_loop()
+        dl = self.downloader
+        connect_timeout, read_timeout = dl.timeout
+        connections, per_host = self.concurrency, dl.pool_size
+        if dl.segment_threshold:
+            # 分段下载时每页最多同时占用 segments 个连接，连接数不足会让各页互相等待
+            connections = per_host = self.concurrency * dl.segments
+        connector = aiohttp.TCPConnector(limit=connections, limit_per_host=per_host)
+        timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        count = 0
+        pending = set()
+        submitted = set()
+        async with aiohttp.ClientSession(headers=IMAGE_HEADERS, connector=connector, timeout=timeout) as session:
+            try:
+                while count < limit and not dl.cancel_token.cancelled:
+                    # 在途作品数与线程池方式一致，页面级并发由信号量限制
+                    while (pending and (len(pending) >= self.concurrency or count + len(pending) >= limit)
+                           and not dl.cancel_token.cancelled):
+                        done, pending = await asyncio.wait(pending, timeout=0.1,
+                                                           return_when=asyncio.FIRST_COMPLETED)
+                        count = dl._collect_finished(done, count, limit, progress_callback)
+                    if count >= limit or dl.cancel_token.cancelled:
+                        break
+                    illust = await loop.run_in_executor(None, next, illusts, _END)
+                    if illust is _END:
+                        break
+                    if illust['id'] in submitted or not dl._should_download(illust):
+                        if dl._should_give_up():
+                            break
+                        continue
+                    submitted.add(illust['id'])
+                    pending.add(asyncio.ensure_future(self._download_illust(session, illust)))
+                while pending and count < limit and not dl.cancel_token.cancelled:
+                    done, pending = await asyncio.wait(pending, timeout=0.1, return_when=asyncio.FIRST_COMPLETED)
+                    count = dl._collect_finished(done, count, limit, progress_callback)
+            finally:
+                for task in pending:
+                    task.cancel()
+                if pending:
+                    await asyncio.gather(*pending, return_exceptions=True)
+                with dl.metrics.stage('ledger_commit'):
+                    dl.ledger.flush()
+        return count
+
+    async def _sleep(self, seconds):
+        """限速等待，每 0.1 秒检查一次取消"""
+        token = self.downloader.cancel_token
+        deadline = time.monotonic() + seconds
+        while True:
+            token.check()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(min(remaining, 0.1))
+
+    async def _download_illust(self, session, illust):
+        dl = self.downloader
+        if illust.get('type') == 'ugoira':
+            # 动图需要先同步请求元数据，整体交给线程执行，合成在进程池中进行
+            return await asyncio.get_running_loop().run_in_executor(None, dl.download_illust, illust)
+        if not dl._claim(illust):
+            return False
+        try:
+            illust_id = illust['id']
+            targets = dl._page_targets(illust)
+            sizes = await self._gather_pages(self._download_target(session, illust_id, *target) for target in targets)
+            dl._record_illust(illust, len(targets), sum(sizes))
+            return True
+        except DownloadCancelled:
+            dl.metrics.inc('illusts_cancelled')
+            dl.ledger.release(illust['id'])
+            return False
+        except Exception as e:
+            dl._record_failure(illust, e)
+            return False
+
+    @staticmethod
+    async def _gather_pages(coros):
+        """并发下载作品的各页，返回各页字节数
+
+        某一页失败（或被取消）时取消其余的页并等待它们退出，再抛出该页的异常，
+        避免作品已记入失败队列后其余页仍在后台下载、占用连接名额。
+        """
+        tasks = [asyncio.ensure_future(coro) for coro in coros]
+        if not tasks:
+            return []
+        try:
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        finally:
+            # 外层任务被取消时同样需要清理各页
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        for task in tasks:
+            if task.done() and not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+        return [task.result() for task in tasks]
+
+    async def _download_target(self, session, illust_id, page, url, filepath):
+        dl = self.downloader
+        done = dl._finished_page_size(illust_id, page, filepath)
+        if done is not None:
+            return done
+        for attempt in range(dl.max_retries + 1):
+            try:
+                async with self._semaphore:
+                    size = await self._download_page(session, url, filepath)
+                break
+            except Exception as e:
+                retryable, retry_after = _retry_info(e)
+                if not retryable or attempt >= dl.max_retries:
+                    raise
+                delay = retry_delay(attempt, dl.retry_backoff, retry_after)
+                dl.metrics.inc('page_retries')
+                dl.log(f"下载出错，{delay:.1f} 秒后重试 ({attempt + 1}/{dl.max_retries}) {filepath.name}: {e}")
+                await self._sleep(delay)
+        dl.ledger.record_page(illust_id, page, filepath, size)
+        dl.log(f"✓ 下载完成: {filepath.name}")
+        return size
+
+    @staticmethod
+    async def _in_thread(func, *args):
+        """在默认线程池中执行会读写磁盘或下载记录的同步操作"""
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def _acquire_host(self, host):
+        """等待该主机的连接名额；上限可能被其他线程调整，按短间隔轮询"""
+        dl = self.downloader
+        connections = dl.transfer_limiter.connections
+        wait_start = time.perf_counter()
+        while not connections.try_acquire(host):
+            dl.cancel_token.check()
+            await asyncio.sleep(0.02)
+        dl.metrics.observe('host_wait', time.perf_counter() - wait_start)
+
+    async def _throttle(self, nbytes):
+        """计入收到的字节并按全局带宽上限等待，返回等待的秒数；每 0.1 秒按当前上限重新计算剩余等待"""
+        limiter = self.downloader.transfer_limiter
+        ticket = limiter.bandwidth.reserve(nbytes)
+        delay = limiter.bandwidth.delay(ticket)
+        waited = 0.0
+        if delay > 0:
+            start = time.perf_counter()
+            while delay > 0:
+                await self._sleep(min(delay, 0.1))
+                delay = limiter.bandwidth.delay(ticket)
+            waited = time.perf_counter() - start
+        limiter.meter.add(nbytes)
+        return waited
+
+    async def _download_page(self, session, url, filepath):
+        """占用一个该主机的连接名额下载单页"""
+        host = urlsplit(url).hostname
+        await self._acquire_host(host)
+        try:
+            return await self._transfer_page(session, url, filepath)
+        finally:
+            self.downloader.transfer_limiter.connections.release(host)
+
+    async def _transfer_page(self, session, url, filepath):
+        """与 PixivDownloader._transfer_page 相同的 .part 续传与原子重命名逻辑"""
+        dl = self.downloader
+        part = filepath.with_name(filepath.name + '.part')
+        offset = part.stat().st_size if part.exists() else 0
+        while True:
+            headers = {'Range': f'bytes={offset}-'} if offset else None
+            with dl.metrics.stage('cdn_wait'):
+                await self._sleep(dl.cdn_limiter.reserve())
+            request_start = time.perf_counter()
+            async with session.get(url, headers=headers) as response:
+                dl.metrics.observe('request', time.perf_counter() - request_start)
+                if response.status in THROTTLE_STATUS:
+                    dl.metrics.inc('cdn_throttled')
+                    dl.cdn_limiter.penalize()
+                else:
+                    dl.cdn_limiter.reward()
+                if offset and response.status == 416:
+                    offset = 0
+                    continue
+                response.raise_for_status()
+                if offset and response.status != 206:
+                    offset = 0
+                if offset:
+                    # 续传时要读入已下载的部分计算哈希，放到线程中执行，不阻塞其他传输
+                    hasher = await self._in_thread(dl._content_hasher, part, offset)
+                else:
+                    hasher = dl._content_hasher(part, 0)
+                expected = offset + response.content_length if response.content_length is not None else None
+                total = response.headers.get('Content-Range', '').rpartition('/')[2]
+                if offset and total.isdigit():
+                    expected = int(total)
+                if not offset and dl._segmentable(response.status, response.headers, expected):
+                    return await self._download_segmented(session, url, response, expected, filepath)
+                write_time = throttle_time = 0.0
+                transfer_start = time.perf_counter()
+                with open(part, 'ab' if offset else 'wb') as f:
+                    async for chunk in response.content.iter_chunked(dl.chunk_size):
+                        dl.cancel_token.check()
+                        write_start = time.perf_counter()
+                        f.write(chunk)
+                        if hasher:
+                            hasher.update(chunk)
+                        write_time += time.perf_counter() - write_start
+                        throttle_time += await self._throttle(len(chunk))
+                dl._observe_transfer(time.perf_counter() - transfer_start, write_time, throttle_time)
+            break
+
+        size = part.stat().st_size
+        if expected is not None and size != expected:
+            if size > expected:
+                part.unlink()
+            raise IncompleteDownload(f"文件不完整: {size}/{expected} 字节")
+        await self._in_thread(dl._commit_page, part, filepath, size, hasher)
+        dl.metrics.inc('pages_downloaded')
+        dl.metrics.inc('bytes_downloaded', size)
+        return size
+
+    async def _download_segmented(self, session, url, response, total, filepath):
+        """与 PixivDownloader._download_segmented 相同的分段下载，各段在事件循环中并发"""
+        dl = self.downloader
+        seg = filepath.with_name(filepath.name + '.seg')
+        bounds = dl._segment_bounds(total)
+        with open(seg, 'wb') as f:
+            f.truncate(total)
+        connections = dl.transfer_limiter.connections
+        host = urlsplit(url).hostname
+        parallel, deferred = [], []
+        for bound in bounds[1:]:
+            (parallel if connections.try_acquire(host) else deferred).append(bound)
+        transfer_start = time.perf_counter()
+        # 取不到连接名额的分段接在第一段之后用当前连接依次下载
+        tasks = [asyncio.ensure_future(self._write_first_segment(session, url, response, seg, bounds[0], deferred))]
+        tasks += [asyncio.ensure_future(self._fetch_segment(session, url, seg, start, end)) for start, end in parallel]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            seg.unlink(missing_ok=True)
+            raise
+        finally:
+            # 任务可能在开始运行前就被取消，名额统一在这里归还
+            for _ in parallel:
+                connections.release(host)
+        dl.metrics.observe('transfer', time.perf_counter() - transfer_start)
+
+        size = seg.stat().st_size
+        if size != total:
+            seg.unlink()
+            raise IncompleteDownload(f"文件不完整: {size}/{total} 字节")
+        # 分段文件是最大的那些图片，读一遍计算哈希和去重查询都在线程中进行
+        await self._in_thread(lambda: dl._commit_page(seg, filepath, size, dl._content_hasher(seg, size)))
+        dl.metrics.inc('pages_segmented')
+        dl.metrics.inc('pages_downloaded')
+        dl.metrics.inc('bytes_downloaded', size)
+        return size
+
+    async def _write_first_segment(self, session, url, response, seg, bound, deferred):
+        await self._write_segment(response.content.iter_chunked(self.downloader.chunk_size), seg, *bound)
+        response.release()
+        for start, end in deferred:
+            await self._fetch_segment(session, url, seg, start, end)
+
+    async def _fetch_segment(self, session, url, seg, start, end):
+        dl = self.downloader
+        with dl.metrics.stage('cdn_wait'):
+            await self._sleep(dl.cdn_limiter.reserve())
+        request_start = time.perf_counter()
+        async with session.get(url, headers={'Range': f'bytes={start}-{end - 1}'}) as response:
+            dl.metrics.observe('request', time.perf_counter() - request_start)
+            if response.status in THROTTLE_STATUS:
+                dl.metrics.inc('cdn_throttled')
+                dl.cdn_limiter.penalize()
+            else:
+                dl.cdn_limiter.reward()
+            response.raise_for_status()
+            if response.status != 206:
+                raise IOError(f"服务器未按范围返回分段: HTTP {response.status}")
+            await self._write_segment(response.content.iter_chunked(dl.chunk_size), seg, start, end)
+
+    async def _write_segment(self, chunks, seg, start, end):
+        remaining = end - start
+        with open(seg, 'r+b') as f:
+            f.seek(start)
+            async for chunk in chunks:
+                self.downloader.cancel_token.check()
+                f.write(chunk[:remaining])
+                await self._throttle(min(len(chunk), remaining))
+                remaining -= min(len(chunk), remaining)
+                if not remaining:
+                    return
+        raise IncompleteDownload(f"分段 {start}-{end - 1} 不完整，缺少 {remaining} 字节")
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+
+# access_token 的缓存文件，按 refresh_token 的哈希分别保存，不保存 refresh_token 本身
+DEFAULT_CACHE_PATH = Path.home() / '.quickpixiv' / 'auth.json'
+# 距离过期不足此秒数时提前刷新，避免长时间下载中途过期
+REFRESH_MARGIN = 300
+# 认证响应没有给出有效期时按 1 小时计
+DEFAULT_EXPIRES_IN = 3600
+
+_managers = {}
+_managers_lock = threading.Lock()
+# 多个账号共用一个缓存文件，读改写期间加锁
+_cache_file_lock = threading.Lock()
+
+
+def get_auth_manager(refresh_token, cache_path=DEFAULT_CACHE_PATH):
+    """返回该 refresh_token 对应的共享 AuthManager，同一进程内的下载和验证共用一个已登录的 API 客户端"""
+    with _managers_lock:
+        manager = _managers.get(refresh_token)
+        if manager is None:
+            manager = _managers[refresh_token] = AuthManager(refresh_token, cache_path)
+        return manager
+
+
+def is_auth_error(error):
+    """API 结果中的 error 是否表示 access_token 失效
+
+    Pixiv 对过期或被吊销的 access_token 返回 HTTP 400 和 OAuth 错误信息（相当于 401），
+    pixivpy3 不暴露状态码，只能按错误信息判断。
+    """
+    if not error:
+        return False
+    message = str(error.get('message', '')) if isinstance(error, dict) else str(error)
+    return 'oauth' in message.lower() or 'invalid_grant' in message.lower()
+
+
+class AuthManager:
+    """用 refresh_token 换取 access_token，并在内存和磁盘上缓存到过期前
+
+    只有首次使用且磁盘缓存无效、即将过期或 API 报告 access_token 失效时才发起 OAuth 请求；
+    多次下载、多个线程和界面上的验证按钮共用同一个已登录的 AppPixivAPI。
+    缓存文件权限为 0600，目录为 0700。
+    """
+
+    def __init__(self, refresh_token, cache_path=DEFAULT_CACHE_PATH, margin=REFRESH_MARGIN):
+        self.refresh_token = refresh_token
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.margin = margin
+        self._api = None
+        self.expires_at = 0.0
+        self.user_name = None
+        self._key = hashlib.sha256(refresh_token.encode()).hexdigest()
+        self._lock = threading.Lock()
+        # 创建客户端单独加锁：ensure() 持有 _lock 时会读取 api
+        self._api_lock = threading.Lock()
+        self._cache_loaded = False
+
+    @property
+    def api(self):
+        """共享的 AppPixivAPI，首次使用时才导入 pixivpy3（连带 cloudscraper），加快程序启动"""
+        if self._api is None:
+            with self._api_lock:
+                if self._api is None:
+                    from pixivpy3 import AppPixivAPI
+                    self._api = AppPixivAPI()
+        return self._api
+
+    @property
+    def valid(self):
+        return bool(self.api.access_token) and time.time() < self.expires_at - self.margin
+
+    def ensure(self):
+        """确保持有未过期的 access_token，本次发起了 OAuth 请求时返回 True"""
+        with self._lock:
+            if self.valid:
+                return False
+            if not self._cache_loaded:
+                self._cache_loaded = True
+                if self._load_cache() and self.valid:
+                    return False
+            self._refresh()
+            return True
+
+    def invalidate(self, access_token=None):
+        """标记 access_token 失效，下次 ensure() 时刷新
+
+        传入请求时使用的 access_token，其他线程已经刷新过的新 token 不会被再次作废。
+        """
+        with self._lock:
+            if access_token is None or access_token == self.api.access_token:
+                self.expires_at = 0.0
+
+    def _refresh(self):
+        result = self.api.auth(refresh_token=self.refresh_token)
+        response = result.get('response') or {}
+        self.expires_at = time.time() + (response.get('expires_in') or DEFAULT_EXPIRES_IN)
+        self.user_name = (response.get('user') or {}).get('name')
+        self._save_cache()
+
+    def _read_cache_file(self):
+        try:
+            with open(self.cache_path, encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def _load_cache(self):
+        if not self.cache_path:
+            return False
+        entry = self._read_cache_file().get(self._key)
+        try:
+            access_token, user_id, expires_at = entry['access_token'], entry['user_id'], float(entry['expires_at'])
+        except (KeyError, TypeError, ValueError):
+            return False
+        self.api.set_auth(access_token, self.refresh_token)
+        self.api.user_id = user_id
+        self.expires_at = expires_at
+        self.user_name = entry.get('user_name')
+        return True
+
+    def _save_cache(self):
+        if not self.cache_path:
+            return
+        with _cache_file_lock:
+            now = time.time()
+            # 顺带清理已过期的其他账号条目
+            entries = {key: entry for key, entry in self._read_cache_file().items()
+                       if isinstance(entry, dict) and entry.get('expires_at', 0) > now}
+            entries[self._key] = {'access_token': self.api.access_token, 'user_id': self.api.user_id,
+                                  'user_name': self.user_name, 'expires_at': self.expires_at}
+            tmp = self.cache_path.with_name(f"{self.cache_path.name}.{os.getpid()}.tmp")
+            try:
+                self.cache_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+                fd = os.open(str(tmp), os.O_CREAT | os.O_TRUNC | os.O_WRONLY, 0o600)
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(entries, f)
+                os.replace(tmp, self.cache_path)
+            except OSError:
+                # 缓存写不进去只影响下次启动的登录次数
+                tmp.unlink(missing_ok=True)
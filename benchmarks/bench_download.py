@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+PixivDownloader 离线基准测试
+
+在本地模拟服务器上运行推荐作品和关注画师两条下载路径，统计作品/秒、字节/秒、
+单页下载延迟 p50/p99 和峰值内存，结果以 JSON Lines 追加写入文件，便于跟踪性能回归。
+
+用法（在项目根目录运行）:
+    python -m benchmarks.bench_download --illusts 200 --engine threaded asyncio --output bench.jsonl
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.fake_pixiv import FakePixivServer
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    # 最近秩法
+    index = max(0, math.ceil(pct / 100 * len(values)) - 1)
+    return round(values[index], 6)
+
+
+def peak_rss_bytes():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parent).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def timed(latencies, func):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        latencies.append(time.perf_counter() - start)
+        return result
+    return wrapper
+
+
+def timed_async(latencies, func):
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = await func(*args, **kwargs)
+        latencies.append(time.perf_counter() - start)
+        return result
+    return wrapper
+
+
+def run_scenario(params):
+    """在当前进程中运行一个场景，返回结果字典（在子进程中调用以单独统计峰值内存）"""
+    from pixiv_downloader import PixivDownloader
+
+    server = FakePixivServer(**params['server']).start()
+    latencies = []
+    try:
+        with tempfile.TemporaryDirectory() as download_path:
+            downloader = PixivDownloader(refresh_token='bench', download_path=download_path, log_func=lambda msg: None,
+                                         **params['downloader'])
+            downloader.api.hosts = server.base_url
+            # 模拟服务器的登录凭据不写入用户的登录缓存
+            downloader.auth.cache_path = None
+            if downloader.engine == 'asyncio':
+                import async_engine
+                async_engine.AsyncDownloadEngine._download_page = timed_async(
+                    latencies, async_engine.AsyncDownloadEngine._download_page)
+            else:
+                downloader._download_page = timed(latencies, downloader._download_page)
+
+            start = time.perf_counter()
+            if params['path'] == 'recommended':
+                illusts = downloader.download_recommended()
+            else:
+                illusts = downloader.download_following()
+            elapsed = time.perf_counter() - start
+            stages = {name: {'count': h.count, 'seconds': round(h.sum, 4)}
+                      for name, h in downloader.metrics.histograms.items()}
+            deduplicated = downloader.metrics.counters.get('pages_deduplicated', 0)
+            downloader.close()
+            total_bytes = sum(f.stat().st_size for f in Path(download_path).rglob('*.jpg'))
+    finally:
+        server.stop()
+
+    return {
+        'illusts': illusts,
+        'pages': len(latencies),
+        'pages_deduplicated': deduplicated,
+        'bytes': total_bytes,
+        'seconds': round(elapsed, 4),
+        'illusts_per_sec': round(illusts / elapsed, 3) if elapsed else None,
+        'bytes_per_sec': round(total_bytes / elapsed) if elapsed else None,
+        'page_latency_p50': percentile(latencies, 50),
+        'page_latency_p99': percentile(latencies, 99),
+        'peak_rss_bytes': peak_rss_bytes(),
+        'stages': stages,
+        'server': dict(server.stats),
+    }
+
+
+def _child(params, queue):
+    try:
+        queue.put(run_scenario(params))
+    except Exception as e:
+        queue.put({'error': repr(e)})
+
+
+def run_isolated(params):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_child, args=(params, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="PixivDownloader 离线基准测试")
+    parser.add_argument('--path', nargs='+', choices=['recommended', 'following'],
+                        default=['recommended', 'following'], help="要测试的下载路径")
+    parser.add_argument('--engine', nargs='+', choices=['threaded', 'asyncio'], default=['threaded'],
+                        help="要测试的下载引擎")
+    parser.add_argument('--workers', type=int, default=4, help="并发下载数")
+    parser.add_argument('--illusts', type=int, default=100, help="每条路径下载的作品数上限")
+    parser.add_argument('--pages', type=int, default=1, help="每个作品的页数")
+    parser.add_argument('--image-size', type=int, default=200 * 1024, help="每页图片字节数")
+    parser.add_argument('--page-size', type=int, default=30, help="API 每页返回的条目数")
+    parser.add_argument('--following', type=int, default=50, help="关注画师数")
+    parser.add_argument('--api-latency', type=float, default=0.05, help="API 响应延迟（秒）")
+    parser.add_argument('--cdn-latency', type=float, default=0.02, help="图片首字节延迟（秒）")
+    parser.add_argument('--cdn-bandwidth', type=int, default=0, help="每个图片连接的带宽（字节/秒），0为不限")
+    parser.add_argument('--rate-limit-ratio', type=float, default=0.0, help="返回限流响应的请求比例")
+    parser.add_argument('--api-rate', type=float, default=0, help="下载器 API 限速（次/秒），0为不限")
+    parser.add_argument('--cdn-rate', type=float, default=0, help="下载器图片限速（次/秒），0为不限")
+    parser.add_argument('--chunk-size', type=int, default=65536, help="下载器读取响应的缓冲区字节数")
+    parser.add_argument('--segment-threshold', type=int, default=0, help="不小于此字节数的图片分段下载，0为关闭")
+    parser.add_argument('--segments', type=int, default=4, help="分段下载的段数")
+    parser.add_argument('--dedup', action=argparse.BooleanOptionalAction, default=True,
+                        help="下载时计算内容哈希并硬链接相同的图片（模拟服务器的每个图片内容都不同）")
+    parser.add_argument('--output', help="把结果以 JSON Lines 追加写入此文件")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    revision = git_revision()
+    results = []
+    for path in args.path:
+        for engine in args.engine:
+            params = {
+                'path': path,
+                'server': {
+                    'illust_count': max(args.illusts, args.page_size),
+                    'following_count': args.following,
+                    'illusts_per_user': max(1, args.illusts // max(1, args.following) + 1),
+                    'pages_per_illust': args.pages,
+                    'image_size': args.image_size,
+                    'page_size': args.page_size,
+                    'api_latency': args.api_latency,
+                    'cdn_latency': args.cdn_latency,
+                    'cdn_bandwidth': args.cdn_bandwidth,
+                    'rate_limit_ratio': args.rate_limit_ratio,
+                },
+                'downloader': {
+                    'min_bookmarks': 0,
+                    'min_likes': 0,
+                    'recommended_limit': args.illusts,
+                    'following_limit': args.illusts,
+                    'following_depth': max(1, args.illusts // max(1, args.following) + 1),
+                    'download_workers': args.workers,
+                    'engine': engine,
+                    'api_rate': args.api_rate,
+                    'cdn_rate': args.cdn_rate,
+                    'cache_ttl': 0,
+                    'chunk_size': args.chunk_size,
+                    'segment_threshold': args.segment_threshold,
+                    'segments': args.segments,
+                    'dedup': args.dedup,
+                },
+            }
+            result = run_isolated(params)
+            record = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'revision': revision, 'path': path,
+                      'engine': engine, 'params': params, 'result': result}
+            results.append(record)
+            print(json.dumps({'path': path, 'engine': engine, **result}, ensure_ascii=False), flush=True)
+
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as f:
+            for record in results:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+启动耗时基准测试
+
+在全新的解释器进程中分别导入各入口模块，统计导入耗时（取多次运行的中位数），
+并检查导入后是否已经加载了应当延迟加载的重型依赖（requests、pixivpy3 等）。
+安装了 PyQt6 时还会以 offscreen 平台创建并显示主窗口，统计从进程启动到窗口显示的耗时。
+结果以 JSON Lines 追加写入文件，便于跟踪启动速度的回归。
+
+用法（在项目根目录运行）:
+    python -m benchmarks.bench_startup --repeat 5 --output bench.jsonl
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from benchmarks.bench_download import git_revision
+
+
+ROOT = Path(__file__).resolve().parent.parent
+# 启动时不应加载的模块，首次下载或验证 Token 时才需要
+LAZY_MODULES = ('requests', 'urllib3', 'pixivpy3', 'cloudscraper', 'http.server', 'concurrent.futures.process')
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+# 与 main.main() 相同的窗口创建过程，不进入事件循环
+WINDOW_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import main
+from PyQt6.QtWidgets import QApplication
+app = QApplication(sys.argv)
+window = main.PixivDownloaderGUI()
+window.show()
+app.processEvents()
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+
+def has_pyqt():
+    try:
+        import PyQt6.QtWidgets  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def run_child(script, env=None):
+    """在新进程中执行脚本，返回 (脚本内计时结果, 含解释器启动的进程总耗时)"""
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-c', script], cwd=ROOT, capture_output=True, text=True,
+                               env=env, check=True)
+    wall = time.perf_counter() - start
+    return json.loads(completed.stdout.strip().splitlines()[-1]), wall
+
+
+def measure(name, script, repeat, env=None):
+    # 先运行一次生成字节码缓存，不计入结果
+    run_child(script, env)
+    samples, walls = [], []
+    loaded = []
+    for _ in range(repeat):
+        result, wall = run_child(script, env)
+        samples.append(result['seconds'])
+        walls.append(wall)
+        loaded = result['loaded']
+    return {
+        'target': name,
+        'seconds_median': round(statistics.median(samples), 4),
+        'seconds_min': round(min(samples), 4),
+        'process_seconds_median': round(statistics.median(walls), 4),
+        'eager_modules': loaded,
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="启动耗时基准测试")
+    parser.add_argument('--modules', nargs='+', default=['main', 'cli', 'pixiv_downloader', 'token_helper'],
+                        help="要测量导入耗时的模块")
+    parser.add_argument('--repeat', type=int, default=5, help="每项测量的次数")
+    parser.add_argument('--output', help="把结果以 JSON Lines 追加写入此文件")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    revision = git_revision()
+    pyqt = has_pyqt()
+    results = []
+    for module in args.modules:
+        if module == 'main' and not pyqt:
+            print(json.dumps({'target': 'import main', 'skipped': '未安装 PyQt6'}, ensure_ascii=False))
+            continue
+        results.append(measure(f'import {module}', IMPORT_SCRIPT.format(module=module, lazy=LAZY_MODULES),
+                               args.repeat))
+    if pyqt:
+        env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+        results.append(measure('window shown', WINDOW_SCRIPT.format(lazy=LAZY_MODULES), args.repeat, env))
+    else:
+        print(json.dumps({'target': 'window shown', 'skipped': '未安装 PyQt6'}, ensure_ascii=False))
+
+    timestamp = time.strftime('%Y-%m-%dT%H:%M:%S')
+    for result in results:
+        print(json.dumps(result, ensure_ascii=False), flush=True)
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as f:
+            for result in results:
+                record = {'timestamp': timestamp, 'revision': revision, 'benchmark': 'startup',
+                          'python': sys.version.split()[0], **result}
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
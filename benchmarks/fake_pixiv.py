@@ -0,0 +1,229 @@
+"""
+本地模拟的 Pixiv App-API 与 i.pximg.net 图片服务器，供离线基准测试使用
+
+实现了 auth/token、illust_recommended、user_following、user_illusts 和图片下载（支持 Range），
+可配置延迟、单连接带宽、图片大小、页数、分页数量以及限流响应（API 返回 403 Rate Limit，CDN 返回 429）的比例。
+把 AppPixivAPI.hosts 指向 base_url 即可让 pixivpy3 直接访问本服务器。
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class FakePixivServer:
+    def __init__(self, illust_count=300, following_count=50, illusts_per_user=30, pages_per_illust=1,
+                 image_size=200 * 1024, page_size=30, api_latency=0.05, cdn_latency=0.02, rate_limit_ratio=0.0,
+                 cdn_bandwidth=0, min_bookmarks=0, max_bookmarks=2000, seed=0):
+        self.illust_count = illust_count
+        self.following_count = following_count
+        self.illusts_per_user = illusts_per_user
+        self.pages_per_illust = pages_per_illust
+        self.image_size = image_size
+        self.page_size = page_size
+        self.api_latency = api_latency
+        self.cdn_latency = cdn_latency
+        # 每个图片连接的带宽（字节/秒），0为不限，用于模拟高延迟链路上的单连接吞吐
+        self.cdn_bandwidth = cdn_bandwidth
+        self.rate_limit_ratio = rate_limit_ratio
+        self.min_bookmarks = min_bookmarks
+        self.max_bookmarks = max_bookmarks
+        self.seed = seed
+        self.image = bytes(random.Random(seed).getrandbits(8) for _ in range(min(image_size, 4096)))
+        self.stats = {'api_requests': 0, 'cdn_requests': 0, 'throttled': 0, 'bytes_sent': 0}
+        self._stats_lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._httpd = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        server = self
+
+        class Handler(FakePixivHandler):
+            fake = server
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+
+    def count(self, name, value=1):
+        with self._stats_lock:
+            self.stats[name] += value
+
+    def should_throttle(self):
+        if not self.rate_limit_ratio:
+            return False
+        with self._stats_lock:
+            throttled = self._random.random() < self.rate_limit_ratio
+            if throttled:
+                self.stats['throttled'] += 1
+        return throttled
+
+    def image_block(self, path):
+        """图片内容按 image 循环重复，每个块开头替换为路径的哈希，不同作品和页的内容互不相同，不会被去重"""
+        digest = hashlib.sha256(path.encode()).digest()
+        return digest[:len(self.image)] + self.image[len(digest):]
+
+    def make_illust(self, illust_id, user_id):
+        rnd = random.Random(illust_id ^ self.seed)
+        pages = self.pages_per_illust
+        image_url = f"{self.base_url}/img-original/img/2024/01/01/00/00/00/{illust_id}_p{{}}.jpg"
+        sizes = ('square_medium', 'medium', 'large')
+        image_urls = {size: image_url.format(0) + f"?{size}" for size in sizes}
+        meta_pages = []
+        if pages > 1:
+            meta_pages = [{'image_urls': dict({size: image_url.format(i) + f"?{size}" for size in sizes},
+                                              original=image_url.format(i))} for i in range(pages)]
+        return {
+            'id': illust_id,
+            'title': f"illust {illust_id}",
+            'type': 'illust',
+            'image_urls': image_urls,
+            'user': {'id': user_id, 'name': f"user{user_id}", 'account': f"user{user_id}"},
+            'tags': [{'name': f"tag{illust_id % 10}", 'translated_name': None}],
+            'create_date': time.strftime('%Y-%m-%dT%H:%M:%S+09:00', time.gmtime(1700000000 + illust_id)),
+            'page_count': pages,
+            'sanity_level': 2,
+            'x_restrict': 0,
+            'meta_single_page': {'original_image_url': image_url.format(0)} if pages == 1 else {},
+            'meta_pages': meta_pages,
+            'total_view': rnd.randint(self.min_bookmarks, self.max_bookmarks) * 10,
+            'total_bookmarks': rnd.randint(self.min_bookmarks, self.max_bookmarks),
+            'illust_ai_type': 1,
+        }
+
+    def next_url(self, path, offset, total, **params):
+        if offset + self.page_size >= total:
+            return None
+        query = '&'.join(f"{key}={value}" for key, value in dict(params, offset=offset + self.page_size).items())
+        return f"{self.base_url}{path}?{query}"
+
+    def recommended(self, query):
+        offset = int(query.get('offset', 0))
+        end = min(offset + self.page_size, self.illust_count)
+        illusts = [self.make_illust(100000000 + i, 1000 + i % 97) for i in range(offset, end)]
+        return {'illusts': illusts, 'ranking_illusts': [], 'contest_exists': False,
+                'next_url': self.next_url('/v1/illust/recommended', offset, self.illust_count,
+                                          content_type='illust', filter='for_ios')}
+
+    def following(self, query):
+        offset = int(query.get('offset', 0))
+        end = min(offset + self.page_size, self.following_count)
+        users = [{'user': {'id': 2000 + i, 'name': f"user{2000 + i}"}, 'illusts': []} for i in range(offset, end)]
+        return {'user_previews': users,
+                'next_url': self.next_url('/v1/user/following', offset, self.following_count,
+                                          user_id=query.get('user_id', 1), restrict='public')}
+
+    def user_illusts(self, query):
+        user_id = int(query['user_id'])
+        offset = int(query.get('offset', 0))
+        end = min(offset + self.page_size, self.illusts_per_user)
+        # 按作品ID从新到旧排列，与 Pixiv 一致
+        illusts = [self.make_illust(user_id * 100000 + self.illusts_per_user - i, user_id) for i in range(offset, end)]
+        return {'illusts': illusts,
+                'next_url': self.next_url('/v1/user/illusts', offset, self.illusts_per_user,
+                                          user_id=user_id, filter='for_ios', type='illust')}
+
+
+class FakePixivHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    fake = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        if urlparse(self.path).path != '/auth/token':
+            return self.send_json(404, {'error': {'message': 'not found'}})
+        time.sleep(self.fake.api_latency)
+        user = {'id': '1', 'name': 'bench', 'account': 'bench'}
+        self.send_json(200, {'access_token': 'bench', 'expires_in': 3600, 'refresh_token': 'bench', 'user': user,
+                             'response': {'access_token': 'bench', 'expires_in': 3600,
+                                          'refresh_token': 'bench', 'user': user}})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.startswith('/img-original/'):
+            return self.serve_image()
+        routes = {
+            '/v1/illust/recommended': self.fake.recommended,
+            '/v1/user/following': self.fake.following,
+            '/v1/user/illusts': self.fake.user_illusts,
+        }
+        route = routes.get(url.path)
+        if route is None:
+            return self.send_json(404, {'error': {'message': 'not found'}})
+        self.fake.count('api_requests')
+        time.sleep(self.fake.api_latency)
+        if self.fake.should_throttle():
+            return self.send_json(403, {'error': {'user_message': '', 'message': 'Rate Limit', 'reason': ''}})
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        self.send_json(200, route(query))
+
+    def serve_image(self):
+        fake = self.fake
+        fake.count('cdn_requests')
+        time.sleep(fake.cdn_latency)
+        if fake.should_throttle():
+            self.send_response(429)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        size = fake.image_size
+        start, end = 0, size - 1
+        range_header = self.headers.get('Range')
+        if range_header:
+            first, _, last = range_header.partition('=')[2].partition('-')
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+            if start >= size:
+                self.send_response(416)
+                self.send_header('Content-Range', f"bytes */{size}")
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        block = fake.image_block(urlparse(self.path).path)
+        position = start
+        while position <= end:
+            offset = position % len(block)
+            chunk = block[offset:offset + end - position + 1]
+            try:
+                self.wfile.write(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                # 分段下载读完第一段后会直接断开连接
+                return
+            position += len(chunk)
+            if fake.cdn_bandwidth:
+                time.sleep(len(chunk) / fake.cdn_bandwidth)
+        fake.count('bytes_sent', end - start + 1)
@@ -0,0 +1,37 @@
+import threading
+
+
+class DownloadCancelled(Exception):
+    """下载被用户或信号取消"""
+
+
+class CancelToken:
+    """协作式取消标记
+
+    由任意线程调用 cancel()；遍历、限速等待、下载数据块循环和队列等待中定期调用 check() 或 sleep()，
+    取消后在这些检查点抛出 DownloadCancelled。
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise DownloadCancelled("下载已取消")
+
+    def sleep(self, seconds):
+        """可被取消的 sleep，取消时立即抛出 DownloadCancelled"""
+        if seconds > 0 and self._event.wait(seconds):
+            raise DownloadCancelled("下载已取消")
+        self.check()
+
+    def wait(self, timeout=None):
+        """等待取消，返回是否已取消（不抛异常，用于守护模式的间隔等待）"""
+        return self._event.wait(timeout)
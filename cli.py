@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Pixiv自动下载器 命令行入口
+无需图形界面，支持单次运行和按间隔循环同步的守护模式（适合 systemd）
+
+配置优先级: 命令行参数 > 环境变量 > 配置文件 > 默认值
+"""
+import argparse
+import configparser
+import os
+import signal
+import sys
+import time
+from pathlib import Path
+
+from cancel import CancelToken
+from metrics import Metrics
+from path_template import PathTemplate
+from pixiv_downloader import PixivDownloader
+from rate_limiter import TransferLimiter
+
+
+# 配置项: (类型, 默认值)，与 GUI 的默认设置保持一致
+OPTIONS = {
+    'token': (str, ''),
+    'download_path': (str, './downloads'),
+    'mode': (str, 'all'),
+    'recommended_limit': (int, 20),
+    'following_limit': (int, 20),
+    'min_bookmarks': (int, 100),
+    'min_likes': (int, 50),
+    'image_quality': (str, 'original'),
+    'delay': (float, 1.0),
+    'cdn_rate': (float, 10.0),
+    'bandwidth_kb': (int, 0),
+    'host_connections': (int, 0),
+    'download_workers': (int, 4),
+    'engine': (str, 'threaded'),
+    'following_depth': (int, 5),
+    'following_fanout': (int, 4),
+    'incremental': (bool, True),
+    'single_page_only': (bool, False),
+    'dedup': (bool, True),
+    'ugoira_format': (str, 'webp'),
+    'path_template': (str, 'flat'),
+    'ugoira_workers': (int, 0),
+    'chunk_kb': (int, 64),
+    'segment_threshold_mb': (float, 0),
+    'segments': (int, 4),
+    'prefetch_pages': (int, 2),
+    'max_retries': (int, 3),
+    'retry_backoff': (float, 1.0),
+    'cache_ttl': (int, 1800),
+    'interval': (float, 0),
+    'lock_file': (str, ''),
+    'metrics_file': (str, ''),
+    'metrics_port': (int, 0),
+    'include_tags': (list, []),
+    'exclude_tags': (list, []),
+    'illust_types': (list, []),
+    'r18': (str, 'include'),
+    'max_age_days': (int, 0),
+    'max_pages': (int, 0),
+    'date_since': (str, ''),
+    'date_until': (str, ''),
+    'give_up_reject_rate': (float, 0),
+    'give_up_window': (int, 200),
+}
+
+ENV_PREFIX = 'QUICKPIXIV_'
+CONFIG_SECTION = 'quickpixiv'
+# 多账号同步：每个 [account:名称] 小节是一个账号
+ACCOUNT_SECTION_PREFIX = 'account:'
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def parse_list(value):
+    if isinstance(value, list):
+        return value
+    return [item.strip() for item in str(value).split(',') if item.strip()]
+
+
+def convert(name, value):
+    kind = OPTIONS[name][0]
+    if kind is bool:
+        return parse_bool(value)
+    if kind is list:
+        return parse_list(value)
+    return kind(value)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Pixiv自动下载器（命令行）")
+    parser.add_argument('-c', '--config', help="INI 配置文件，读取 [quickpixiv] 小节")
+    parser.add_argument('--token', help=f"refresh_token，也可用环境变量 PIXIV_REFRESH_TOKEN 或 {ENV_PREFIX}TOKEN")
+    parser.add_argument('-o', '--download-path', dest='download_path', help="下载目录")
+    parser.add_argument('--mode', choices=['all', 'recommended', 'following', 'failed'],
+                        help="下载推荐作品、关注画师作品或全部；failed 为重试失败队列中的作品")
+    parser.add_argument('--recommended-limit', dest='recommended_limit', type=int, help="推荐作品数量")
+    parser.add_argument('--following-limit', dest='following_limit', type=int, help="关注画师作品数量")
+    parser.add_argument('--min-bookmarks', dest='min_bookmarks', type=int, help="最小收藏数")
+    parser.add_argument('--min-likes', dest='min_likes', type=int, help="最小点赞数")
+    parser.add_argument('--image-quality', dest='image_quality', choices=['original', 'large', 'medium', 'small'],
+                        help="图片质量")
+    parser.add_argument('--delay', type=float, help="API请求平均间隔（秒）")
+    parser.add_argument('--cdn-rate', dest='cdn_rate', type=float, help="图片请求速率（次/秒），0为不限")
+    parser.add_argument('--bandwidth-kb', dest='bandwidth_kb', type=int,
+                        help="全局下载带宽上限（KB/s），0为不限；守护模式下修改配置文件后发送 SIGHUP 即时生效")
+    parser.add_argument('--host-connections', dest='host_connections', type=int,
+                        help="对同一图片服务器同时进行的请求数上限，0为不限；同样可通过 SIGHUP 调整")
+    parser.add_argument('--workers', dest='download_workers', type=int, help="并发下载数")
+    parser.add_argument('--engine', choices=['threaded', 'asyncio'], help="下载引擎")
+    parser.add_argument('--following-depth', dest='following_depth', type=int, help="每位画师作品数")
+    parser.add_argument('--following-fanout', dest='following_fanout', type=int, help="画师并发数")
+    parser.add_argument('--no-incremental', dest='incremental', action='store_const', const=False,
+                        help="关闭关注画师增量同步")
+    parser.add_argument('--single-page-only', dest='single_page_only', action='store_const', const=True,
+                        help="多页作品只下载第一页")
+    parser.add_argument('--no-dedup', dest='dedup', action='store_const', const=False,
+                        help="关闭相同图片硬链接去重")
+    parser.add_argument('--ugoira-format', dest='ugoira_format', choices=['webp', 'gif', 'apng'], help="动图合成格式")
+    parser.add_argument('--path-template', dest='path_template',
+                        help="文件路径模板，预设 flat/artist/id_prefix/shard/date 或自定义如 {user_id}/{id}{page}.{ext}")
+    parser.add_argument('--ugoira-workers', dest='ugoira_workers', type=int, help="动图合成进程数，默认为 CPU 核数的一半")
+    parser.add_argument('--chunk-kb', dest='chunk_kb', type=int, help="读取图片响应的缓冲区大小（KB）")
+    parser.add_argument('--segment-threshold-mb', dest='segment_threshold_mb', type=float,
+                        help="不小于此大小（MB）的图片分段并发下载，0为关闭")
+    parser.add_argument('--segments', type=int, help="分段下载的段数")
+    parser.add_argument('--prefetch-pages', dest='prefetch_pages', type=int,
+                        help="元数据遍历最多领先下载的页数，0为不预取")
+    parser.add_argument('--max-retries', dest='max_retries', type=int, help="单页下载和API请求失败后的重试次数")
+    parser.add_argument('--retry-backoff', dest='retry_backoff', type=float,
+                        help="重试等待的指数退避基准（秒），实际等待为 0 到 基准×2^重试次数 之间的随机值")
+    parser.add_argument('--cache-ttl', dest='cache_ttl', type=int, help="API缓存有效期（秒），0为关闭")
+    parser.add_argument('--interval', type=float, help="守护模式：每隔多少分钟同步一次，0为只运行一次")
+    parser.add_argument('--lock-file', dest='lock_file', help="锁文件路径，默认为下载目录下的 quickpixiv.lock")
+    parser.add_argument('--metrics-file', dest='metrics_file', help="把各阶段耗时和计数以 JSON Lines 追加写入此文件")
+    parser.add_argument('--metrics-port', dest='metrics_port', type=int,
+                        help="在 127.0.0.1 的此端口以 Prometheus 文本格式提供 /metrics")
+    parser.add_argument('--include-tags', dest='include_tags', type=parse_list, help="逗号分隔，作品含任一标签才下载")
+    parser.add_argument('--exclude-tags', dest='exclude_tags', type=parse_list, help="逗号分隔，作品含任一标签则跳过")
+    parser.add_argument('--types', dest='illust_types', type=parse_list, help="逗号分隔的作品类型: illust,manga,ugoira")
+    parser.add_argument('--r18', choices=['include', 'exclude', 'only'], help="R-18作品: 包含、排除或仅R-18")
+    parser.add_argument('--max-age-days', dest='max_age_days', type=int, help="只下载最近多少天发布的作品")
+    parser.add_argument('--max-pages', dest='max_pages', type=int, help="跳过页数超过此值的作品")
+    parser.add_argument('--since', dest='date_since', help="只下载此日期（YYYY-MM-DD）及之后发布的作品")
+    parser.add_argument('--until', dest='date_until', help="只下载此日期（YYYY-MM-DD）及之前发布的作品")
+    parser.add_argument('--give-up-reject-rate', dest='give_up_reject_rate', type=float,
+                        help="最近 N 个作品被筛掉的比例达到此值（0-1）时停止遍历")
+    parser.add_argument('--give-up-window', dest='give_up_window', type=int, help="计算被筛掉比例的作品数 N")
+    return parser
+
+
+def load_options(args):
+    """合并默认值、配置文件、环境变量和命令行参数"""
+    options = {name: default for name, (_, default) in OPTIONS.items()}
+
+    if args.config:
+        config = configparser.ConfigParser()
+        if not config.read(args.config, encoding='utf-8'):
+            raise SystemExit(f"无法读取配置文件: {args.config}")
+        if config.has_section(CONFIG_SECTION):
+            for name, value in config.items(CONFIG_SECTION):
+                if name in OPTIONS:
+                    options[name] = convert(name, value)
+
+    if os.environ.get('PIXIV_REFRESH_TOKEN'):
+        options['token'] = os.environ['PIXIV_REFRESH_TOKEN']
+    for name in OPTIONS:
+        value = os.environ.get(ENV_PREFIX + name.upper())
+        if value:
+            options[name] = convert(name, value)
+
+    for name in OPTIONS:
+        value = getattr(args, name, None)
+        if value is not None:
+            options[name] = value
+    return options
+
+
+def load_accounts(config_path, options):
+    """读取配置文件中的 [account:名称] 小节，返回 [(名称, 该账号的配置), ...]
+
+    小节中可以覆盖任意配置项，未设置的沿用公共配置；download_path 默认为公共下载目录下以账号名命名的子目录。
+    """
+    if not config_path:
+        return []
+    config = configparser.ConfigParser()
+    config.read(config_path, encoding='utf-8')
+    accounts = []
+    for section in config.sections():
+        if not section.startswith(ACCOUNT_SECTION_PREFIX):
+            continue
+        name = section[len(ACCOUNT_SECTION_PREFIX):].strip()
+        account = dict(options, download_path=str(Path(options['download_path']) / name))
+        for key, value in config.items(section):
+            if key in OPTIONS:
+                account[key] = convert(key, value)
+        if not account['token']:
+            raise SystemExit(f"账号 {name} 缺少 token")
+        accounts.append((name, account))
+    return accounts
+
+
+def downloader_kwargs(options):
+    """把配置项转换为 PixivDownloader 的参数"""
+    return dict(
+        refresh_token=options['token'],
+        download_path=options['download_path'],
+        min_bookmarks=options['min_bookmarks'],
+        min_likes=options['min_likes'],
+        image_quality=options['image_quality'],
+        recommended_limit=options['recommended_limit'],
+        following_limit=options['following_limit'],
+        delay=options['delay'],
+        single_page_only=options['single_page_only'],
+        download_workers=options['download_workers'],
+        cdn_rate=options['cdn_rate'],
+        engine=options['engine'],
+        following_depth=options['following_depth'],
+        following_fanout=options['following_fanout'],
+        incremental=options['incremental'],
+        dedup=options['dedup'],
+        ugoira_format=options['ugoira_format'],
+        path_template=options['path_template'],
+        ugoira_workers=options['ugoira_workers'] or None,
+        chunk_size=options['chunk_kb'] * 1024,
+        segment_threshold=int(options['segment_threshold_mb'] * 1024 * 1024),
+        segments=options['segments'],
+        cache_ttl=options['cache_ttl'],
+        include_tags=options['include_tags'] or None,
+        exclude_tags=options['exclude_tags'] or None,
+        illust_types=options['illust_types'] or None,
+        r18=options['r18'],
+        max_age_days=options['max_age_days'] or None,
+        max_pages=options['max_pages'] or None,
+        date_since=options['date_since'] or None,
+        date_until=options['date_until'] or None,
+        give_up_reject_rate=options['give_up_reject_rate'] or None,
+        give_up_window=options['give_up_window'],
+        prefetch_pages=options['prefetch_pages'],
+        max_retries=options['max_retries'],
+        retry_backoff=options['retry_backoff'],
+    )
+
+
+def create_transfer_limiter(options):
+    return TransferLimiter(options['bandwidth_kb'] * 1024, options['host_connections'])
+
+
+def create_downloader(options, log_func, metrics=None, cancel_token=None, transfer_limiter=None):
+    return PixivDownloader(metrics=metrics, cancel_token=cancel_token, log_func=log_func,
+                           transfer_limiter=transfer_limiter or create_transfer_limiter(options),
+                           **downloader_kwargs(options))
+
+
+def log(msg):
+    print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {msg}", flush=True)
+
+
+def _pid_alive(pid):
+    """进程是否仍在运行
+
+    Windows 上 os.kill(pid, 0) 不是存在性检查，而是向该进程发送 CTRL_C_EVENT，
+    改用 OpenProcess 和 GetExitCodeProcess 查询。
+    """
+    if os.name == 'nt':
+        import ctypes
+        from ctypes import wintypes
+
+        process_query_limited_information = 0x1000
+        error_access_denied = 5
+        still_active = 259
+        kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+        kernel32.OpenProcess.argtypes = (wintypes.DWORD, wintypes.BOOL, wintypes.DWORD)
+        kernel32.OpenProcess.restype = wintypes.HANDLE
+        kernel32.GetExitCodeProcess.argtypes = (wintypes.HANDLE, ctypes.POINTER(wintypes.DWORD))
+        kernel32.CloseHandle.argtypes = (wintypes.HANDLE,)
+        handle = kernel32.OpenProcess(process_query_limited_information, False, pid)
+        if not handle:
+            # 没有权限打开说明进程存在（属于其他用户或更高权限）
+            return ctypes.get_last_error() == error_access_denied
+        try:
+            code = wintypes.DWORD()
+            if not kernel32.GetExitCodeProcess(handle, ctypes.byref(code)):
+                return True
+            return code.value == still_active
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # 没有权限发送信号说明进程存在
+        return True
+    return True
+
+
+def cap_cache_ttl(interval, configs):
+    """守护模式下把 API 缓存有效期限制为同步间隔的一半
+
+    缓存的作品列表必须在下次同步开始前过期，否则下次同步会重复使用上次的结果，错过期间发布的新作品。
+    """
+    max_ttl = int(interval * 60 // 2)
+    capped = False
+    for config in configs:
+        if config['cache_ttl'] > max_ttl:
+            config['cache_ttl'] = max_ttl
+            capped = True
+    if capped:
+        log(f"守护模式下 API 缓存有效期调整为 {max_ttl} 秒（同步间隔的一半），每次同步都重新获取作品列表")
+
+
+class LockFile:
+    """基于 O_EXCL 创建的进程锁，持有者进程已退出的锁文件会被清理"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._fd = None
+
+    def _stale(self):
+        try:
+            pid = int(self.path.read_text().strip())
+        except (OSError, ValueError):
+            return True
+        return not _pid_alive(pid)
+
+    def acquire(self):
+        for _ in range(2):
+            try:
+                self._fd = os.open(str(self.path), os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+                os.write(self._fd, str(os.getpid()).encode())
+                return True
+            except FileExistsError:
+                if not self._stale():
+                    return False
+                self.path.unlink()
+        return False
+
+    def release(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+            self.path.unlink()
+
+
+def sync_accounts(options, accounts, cancel_token, metrics=None, transfer_limiter=None):
+    """多个账号并行同步一次，共用公共下载目录中的下载记录和带宽上限，返回下载的作品总数"""
+    from multi_account import MultiAccountSync
+
+    sync = MultiAccountSync([(name, downloader_kwargs(account)) for name, account in accounts],
+                            Path(options['download_path']) / 'downloads.db', cancel_token=cancel_token,
+                            metrics=metrics, transfer_limiter=transfer_limiter or create_transfer_limiter(options),
+                            log_func=log)
+    try:
+        results = sync.run(options['mode'])
+    finally:
+        sync.close()
+    for name, account in accounts:
+        log(f"账号 {name}: 下载 {results.get(name, 0)} 个作品，文件保存在: {account['download_path']}")
+    return sum(results.values())
+
+
+def sync_once(options, cancel_token, metrics=None, accounts=None, transfer_limiter=None):
+    """执行一次同步，返回下载的作品数"""
+    if accounts:
+        return sync_accounts(options, accounts, cancel_token, metrics, transfer_limiter)
+    downloader = create_downloader(options, log, metrics, cancel_token, transfer_limiter)
+    total = 0
+    try:
+        if options['mode'] in ('all', 'recommended'):
+            total += downloader.download_recommended()
+        if options['mode'] in ('all', 'following') and not cancel_token.cancelled:
+            total += downloader.download_following()
+        if options['mode'] == 'failed':
+            total += downloader.download_failed()
+    finally:
+        downloader.close()
+    log(f"本次同步完成，共下载 {total} 个作品，文件保存在: {downloader.download_path}")
+    return total
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    options = load_options(args)
+    accounts = load_accounts(args.config, options)
+    if not options['token'] and not accounts:
+        log("缺少 refresh_token，请通过 --token、环境变量 PIXIV_REFRESH_TOKEN 或配置文件提供")
+        return 2
+    for name, account in accounts or [(None, options)]:
+        try:
+            PathTemplate(account['path_template'])
+        except ValueError as e:
+            log(f"路径模板无效: {e}")
+            return 2
+
+    if options['interval']:
+        cap_cache_ttl(options['interval'], [options] + [account for _, account in accounts])
+
+    Path(options['download_path']).mkdir(parents=True, exist_ok=True)
+    lock = LockFile(options['lock_file'] or Path(options['download_path']) / 'quickpixiv.lock')
+    if not lock.acquire():
+        log(f"另一个实例正在运行（锁文件: {lock.path}）")
+        return 1
+
+    cancel_token = CancelToken()
+    # 守护模式下多次同步共用一份统计，/metrics 中的计数持续累加
+    metrics = Metrics(jsonl_path=options['metrics_file'] or None, port=options['metrics_port'] or None)
+    # 带宽和每主机连接数上限在所有账号和守护模式的多次同步之间共用，收到 SIGHUP 时按重新读取的配置调整
+    transfer_limiter = create_transfer_limiter(options)
+
+    def handle_signal(signum, frame):
+        log(f"收到信号 {signum}，停止当前同步后退出...")
+        cancel_token.cancel()
+
+    def handle_reload(signum, frame):
+        try:
+            reloaded = load_options(args)
+        except (SystemExit, Exception) as e:
+            log(f"重新读取配置失败，上限保持不变: {e}")
+            return
+        transfer_limiter.set_limits(reloaded['bandwidth_kb'] * 1024, reloaded['host_connections'])
+        bandwidth = f"{reloaded['bandwidth_kb']} KB/s" if reloaded['bandwidth_kb'] else "不限"
+        log(f"已调整上限：带宽 {bandwidth}，每主机连接数 {reloaded['host_connections'] or '不限'}")
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, handle_reload)
+
+    try:
+        while not cancel_token.cancelled:
+            try:
+                sync_once(options, cancel_token, metrics, accounts, transfer_limiter)
+            except Exception as e:
+                log(f"同步出错: {e}")
+            if not options['interval']:
+                break
+            log(f"下次同步将在 {options['interval']:g} 分钟后开始")
+            cancel_token.wait(options['interval'] * 60)
+    finally:
+        metrics.close()
+        lock.release()
+    log("已退出")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
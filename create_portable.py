@@ -29,6 +29,19 @@ def create_portable_package():
     core_files = [
         "main.py",
         "pixiv_downloader.py", 
+        "rate_limiter.py",
+        "download_ledger.py",
+        "api_cache.py",
+        "async_engine.py",
+        "metrics.py",
+        "cli.py",
+        "filters.py",
+        "ugoira.py",
+        "cancel.py",
+        "auth_manager.py",
+        "multi_account.py",
+        "path_template.py",
+        "migrate_layout.py",
         "token_helper.py",
         "requirements.txt",
         "run.bat",
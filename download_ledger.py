@@ -0,0 +1,253 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+class DownloadLedger:
+    """已下载作品记录，基于 SQLite（WAL 模式）
+
+    以作品ID为主键，查询走 B 树索引，不需要在启动时把全部记录读入内存。
+    写入先进入内存批次，达到 batch_size 或调用 flush() 时一次性提交。
+    """
+
+    def __init__(self, path, batch_size=50):
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self._pending = {}
+        self._pending_pages = {}
+        self._pending_hashes = {}
+        # 正在下载的作品ID，多个下载器共用同一份记录时避免重复下载同一作品
+        self._claimed = set()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS illusts ("
+            "id INTEGER PRIMARY KEY, user_id INTEGER, user_name TEXT, title TEXT, "
+            "pages INTEGER, quality TEXT, bytes INTEGER, downloaded_at REAL)"
+        )
+        # 按页记录已完成的文件，作品中断后重新下载时跳过已完成的页
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "illust_id INTEGER, page INTEGER, path TEXT, bytes INTEGER, PRIMARY KEY (illust_id, page))"
+        )
+        # 关注画师增量同步的水位线：各账号上次处理到的画师最新作品。多个账号共用一份记录时，
+        # 同一画师在各账号下的筛选和下载进度不同，水位线按 (账号ID, 画师ID) 分开记录；
+        # filter_hash 为推进水位线时筛选条件的摘要，条件改变后水位线作废
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(artist_watermarks)")]
+        if columns and 'account' not in columns:
+            # 旧版只按画师记录，无法判断属于哪个账号；丢弃后下次同步按 following_depth 重新检查一次
+            self._conn.execute("DROP TABLE artist_watermarks")
+        elif columns and 'filter_hash' not in columns:
+            self._conn.execute("ALTER TABLE artist_watermarks ADD COLUMN filter_hash TEXT")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS artist_watermarks ("
+            "account INTEGER, user_id INTEGER, illust_id INTEGER, create_date TEXT, updated_at REAL, "
+            "filter_hash TEXT, PRIMARY KEY (account, user_id))"
+        )
+        # 内容哈希索引：每个文件的 SHA-256，用于把内容相同的页硬链接到同一份数据
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS file_hashes (path TEXT PRIMARY KEY, hash TEXT, bytes INTEGER)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS file_hashes_hash ON file_hashes (hash)")
+        # 重试后仍失败的作品（死信队列），保存完整的作品信息，重试时不需要再遍历 API
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS failures ("
+            "illust_id INTEGER PRIMARY KEY, illust TEXT, error TEXT, attempts INTEGER, failed_at REAL)"
+        )
+        # 队列通常很小，常驻内存，下载成功时不必每次查询数据库
+        self._failed_ids = {row[0] for row in self._conn.execute("SELECT illust_id FROM failures")}
+        self._conn.commit()
+
+    def __contains__(self, illust_id):
+        illust_id = int(illust_id)
+        with self._lock:
+            if illust_id in self._pending:
+                return True
+            row = self._conn.execute("SELECT 1 FROM illusts WHERE id = ?", (illust_id,)).fetchone()
+            return row is not None
+
+    def __len__(self):
+        with self._lock:
+            self._flush_locked()
+            return self._conn.execute("SELECT COUNT(*) FROM illusts").fetchone()[0]
+
+    def claim(self, illust_id):
+        """登记开始下载作品；作品已下载完成或正由其他下载器下载时返回 False
+
+        登记在 record()、record_failure() 或 release() 时解除。
+        """
+        illust_id = int(illust_id)
+        with self._lock:
+            if illust_id in self._claimed or illust_id in self._pending:
+                return False
+            if self._conn.execute("SELECT 1 FROM illusts WHERE id = ?", (illust_id,)).fetchone():
+                return False
+            self._claimed.add(illust_id)
+            return True
+
+    def release(self, illust_id):
+        with self._lock:
+            self._claimed.discard(int(illust_id))
+
+    def record(self, illust_id, user_id=None, user_name=None, title=None, pages=None, quality=None, size=None):
+        with self._lock:
+            self._claimed.discard(int(illust_id))
+            self._pending[int(illust_id)] = (int(illust_id), user_id, user_name, title, pages, quality, size,
+                                             time.time())
+            if len(self._pending) >= self.batch_size:
+                self._flush_locked()
+
+    def record_page(self, illust_id, page, path, size):
+        with self._lock:
+            self._pending_pages[(int(illust_id), page)] = (int(illust_id), page, str(path), size)
+            if len(self._pending_pages) >= self.batch_size:
+                self._flush_locked()
+
+    def get_page(self, illust_id, page):
+        """返回已完成页的 (路径, 字节数)，没有记录时返回 None"""
+        key = (int(illust_id), page)
+        with self._lock:
+            if key in self._pending_pages:
+                return self._pending_pages[key][2:]
+            return self._conn.execute("SELECT path, bytes FROM pages WHERE illust_id = ? AND page = ?",
+                                      key).fetchone()
+
+    def record_hash(self, path, digest, size):
+        """记录文件内容哈希；同一路径重新下载时覆盖旧记录"""
+        with self._lock:
+            self._pending_hashes[str(path)] = (str(path), digest, size)
+            if len(self._pending_hashes) >= self.batch_size:
+                self._flush_locked()
+
+    def find_by_hash(self, digest):
+        """返回内容哈希相同的文件 [(路径, 字节数), ...]"""
+        with self._lock:
+            found = [row[::2] for row in self._pending_hashes.values() if row[1] == digest]
+            for path, size in self._conn.execute("SELECT path, bytes FROM file_hashes WHERE hash = ?", (digest,)):
+                # 尚未提交的记录比数据库中的新
+                if path not in self._pending_hashes:
+                    found.append((path, size))
+            return found
+
+    def page_rows(self):
+        """返回所有已完成页及其作品信息 [(作品ID, 页码, 路径, 画师ID, 画师名, 标题, 页数), ...]"""
+        with self._lock:
+            self._flush_locked()
+            return self._conn.execute(
+                "SELECT p.illust_id, p.page, p.path, i.user_id, i.user_name, i.title, i.pages "
+                "FROM pages p LEFT JOIN illusts i ON i.id = p.illust_id").fetchall()
+
+    def rename_paths(self, mapping):
+        """文件移动后更新已完成页和内容哈希中的路径，mapping 为 {旧路径: 新路径}，在一个事务中提交"""
+        rows = [(str(new), str(old)) for old, new in mapping.items()]
+        with self._lock:
+            self._flush_locked()
+            with self._conn:
+                self._conn.executemany("UPDATE pages SET path = ? WHERE path = ?", rows)
+                self._conn.executemany("UPDATE OR REPLACE file_hashes SET path = ? WHERE path = ?", rows)
+
+    def record_failure(self, illust, error):
+        """把下载失败的作品加入失败队列，已在队列中的累加失败次数"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO failures VALUES (?, ?, ?, 1, ?) ON CONFLICT (illust_id) DO UPDATE SET "
+                "illust = excluded.illust, error = excluded.error, attempts = attempts + 1, failed_at = excluded.failed_at",
+                (int(illust['id']), json.dumps(illust, ensure_ascii=False), str(error), time.time()))
+            self._conn.commit()
+            self._failed_ids.add(int(illust['id']))
+            self._claimed.discard(int(illust['id']))
+
+    def clear_failure(self, illust_id):
+        with self._lock:
+            if int(illust_id) not in self._failed_ids:
+                return
+            self._failed_ids.discard(int(illust_id))
+            self._conn.execute("DELETE FROM failures WHERE illust_id = ?", (int(illust_id),))
+            self._conn.commit()
+
+    def has_failure(self, illust_id):
+        with self._lock:
+            return int(illust_id) in self._failed_ids
+
+    def failures(self):
+        """返回失败队列中的作品信息，按失败时间排列"""
+        with self._lock:
+            rows = self._conn.execute("SELECT illust FROM failures ORDER BY failed_at").fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def failure_count(self):
+        with self._lock:
+            return len(self._failed_ids)
+
+    def get_watermark(self, account, user_id, filter_hash=None):
+        """返回账号下画师的水位线 (作品ID, 创建时间)；没有记录或记录时的筛选条件摘要不同时返回 None"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT illust_id, create_date FROM artist_watermarks "
+                "WHERE account = ? AND user_id = ? AND filter_hash IS ?",
+                (int(account), int(user_id), filter_hash)).fetchone()
+
+    def set_watermark(self, account, user_id, illust_id, create_date=None, filter_hash=None):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO artist_watermarks VALUES (?, ?, ?, ?, ?, ?)",
+                               (int(account), int(user_id), int(illust_id), create_date, time.time(), filter_hash))
+            self._conn.commit()
+
+    def get(self, illust_id):
+        """返回作品的下载记录字典，不存在时返回 None"""
+        with self._lock:
+            self._flush_locked()
+            cursor = self._conn.execute(
+                "SELECT id, user_id, user_name, title, pages, quality, bytes, downloaded_at FROM illusts WHERE id = ?",
+                (int(illust_id),))
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip([c[0] for c in cursor.description], row))
+
+    def _flush_locked(self):
+        if not self._pending and not self._pending_pages and not self._pending_hashes:
+            return
+        self._conn.executemany("INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?)",
+                               list(self._pending_hashes.values()))
+        self._conn.executemany("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)",
+                               list(self._pending_pages.values()))
+        self._conn.executemany("INSERT OR REPLACE INTO illusts VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                               list(self._pending.values()))
+        self._conn.commit()
+        self._pending.clear()
+        self._pending_pages.clear()
+        self._pending_hashes.clear()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        with self._lock:
+            self._flush_locked()
+            self._conn.close()
+
+    def migrate_text_ledger(self, text_path):
+        """导入旧版 downloaded_ids.txt，导入后重命名为 .migrated，返回导入数量"""
+        text_path = Path(text_path)
+        if not text_path.exists():
+            return 0
+        ids = []
+        with open(text_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                # 旧文件可能有写了一半的行，跳过无法解析的内容
+                if line.isdigit():
+                    ids.append((int(line),))
+        with self._lock:
+            self._flush_locked()
+            self._conn.executemany("INSERT OR IGNORE INTO illusts (id) VALUES (?)", ids)
+            self._conn.commit()
+        os.replace(text_path, text_path.with_name(text_path.name + '.migrated'))
+        return len(ids)
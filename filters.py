@@ -0,0 +1,115 @@
+import hashlib
+import json
+from collections import deque
+from datetime import date, timedelta
+
+# 收藏数和浏览数会随时间增长，因这些条件被拒的作品以后可能满足条件
+TRANSIENT_REASONS = frozenset(('bookmarks', 'likes'))
+
+class IllustFilter:
+    """作品筛选条件，每次下载开始时编译一次
+
+    只有设置了的条件才会生成判断函数，未设置的条件没有任何开销；
+    reject_reason() 按顺序执行判断，返回第一个不满足的条件名，全部满足时返回 None。
+
+    日期条件按 create_date 的 ISO 字符串前缀（YYYY-MM-DD）比较，不需要解析时间。
+
+    fingerprint 是收藏数和浏览数以外各条件的摘要，与画师水位线一起保存：被这些条件排除的作品不再检查，
+    条件改变（如放宽标签或日期范围）后旧的水位线作废，之前被排除的作品会重新检查。
+    """
+
+    def __init__(self, min_bookmarks=0, min_likes=0, include_tags=None, exclude_tags=None, types=None,
+                 max_age_days=None, r18='include', max_pages=None, since=None, until=None):
+        self.types = frozenset(types) if types else None
+        self.since = since
+        if max_age_days:
+            cutoff = (date.today() - timedelta(days=max_age_days)).isoformat()
+            self.since = max(self.since, cutoff) if self.since else cutoff
+        self.until = until
+        self.checks = []
+        # 按用户设置的天数而不是算出的日期计算摘要，否则摘要每天都会变化
+        settings = {
+            'types': sorted(self.types or ()), 'max_age_days': max_age_days, 'r18': r18, 'max_pages': max_pages,
+            'since': since, 'until': until,
+            'include_tags': sorted(tag.lower() for tag in include_tags or ()),
+            'exclude_tags': sorted(tag.lower() for tag in exclude_tags or ()),
+        }
+        self.fingerprint = hashlib.sha1(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:16]
+
+        if min_bookmarks:
+            self.checks.append(('bookmarks', lambda illust: illust.get('total_bookmarks', 0) >= min_bookmarks))
+        if min_likes:
+            self.checks.append(('likes', lambda illust: illust.get('total_view', 0) >= min_likes))
+        if self.types:
+            self.checks.append(('type', lambda illust: illust.get('type', 'illust') in self.types))
+        if r18 == 'exclude':
+            self.checks.append(('r18', lambda illust: not illust.get('x_restrict')))
+        elif r18 == 'only':
+            self.checks.append(('r18', lambda illust: bool(illust.get('x_restrict'))))
+        if max_pages:
+            self.checks.append(('pages', lambda illust: illust.get('page_count', 1) <= max_pages))
+        if self.since:
+            self.checks.append(('date', lambda illust: illust.get('create_date', '')[:10] >= self.since))
+        if self.until:
+            self.checks.append(('date', lambda illust: illust.get('create_date', '')[:10] <= self.until))
+        if include_tags:
+            wanted = frozenset(tag.lower() for tag in include_tags)
+            self.checks.append(('tags', lambda illust: not wanted.isdisjoint(_tag_names(illust))))
+        if exclude_tags:
+            banned = frozenset(tag.lower() for tag in exclude_tags)
+            self.checks.append(('tags', lambda illust: banned.isdisjoint(_tag_names(illust))))
+
+    def reject_reason(self, illust):
+        for reason, check in self.checks:
+            if not check(illust):
+                return reason
+        return None
+
+    def older_than_window(self, illust):
+        """作品早于日期窗口的起点；按时间倒序翻页时，遇到这样的作品即可停止"""
+        return bool(self.since) and illust.get('create_date', '')[:10] < self.since
+
+    def api_type(self, default='illust'):
+        """可以下推给 API 的作品类型参数，None 表示同时请求插画和漫画"""
+        if not self.types:
+            return default
+        if self.types == {'manga'}:
+            return 'manga'
+        if 'manga' not in self.types:
+            return 'illust'
+        return None
+
+
+def _tag_names(illust):
+    names = set()
+    for tag in illust.get('tags', []):
+        if tag.get('name'):
+            names.add(tag['name'].lower())
+        if tag.get('translated_name'):
+            names.add(tag['translated_name'].lower())
+    return names
+
+
+class RejectRateMonitor:
+    """统计最近 window 个作品的筛选结果，被拒比例达到 threshold 时建议放弃继续遍历"""
+
+    def __init__(self, threshold, window=200):
+        self.threshold = threshold
+        self.window = window
+        self._results = deque(maxlen=window)
+        self._rejected = 0
+
+    def record(self, rejected):
+        if not self.threshold:
+            return
+        if len(self._results) == self.window:
+            self._rejected -= self._results[0]
+        self._results.append(rejected)
+        self._rejected += rejected
+
+    @property
+    def reject_rate(self):
+        return self._rejected / len(self._results) if self._results else 0.0
+
+    def should_give_up(self):
+        return bool(self.threshold) and len(self._results) == self.window and self.reject_rate >= self.threshold
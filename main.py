@@ -15,52 +15,112 @@ if sys.platform.startswith("win"):
 
 import sys
 import os
+import logging
+import threading
+from collections import deque
+from logging.handlers import RotatingFileHandler
 from pathlib import Path
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QGridLayout, QLabel, QLineEdit, 
-                             QPushButton, QTextEdit, QProgressBar, QSpinBox,
+                             QPushButton, QPlainTextEdit, QProgressBar, QSpinBox,
                              QComboBox, QFileDialog, QGroupBox, QMessageBox, QCheckBox)
-from PyQt6.QtCore import QThread, pyqtSignal, Qt, QSettings
+from PyQt6.QtCore import QThread, QTimer, pyqtSignal, Qt, QSettings
 from PyQt6.QtGui import QFont, QTextCursor, QIcon
-from token_helper import verify_token
-from pixiv_downloader import PixivDownloader
+from rate_limiter import TransferLimiter, format_rate
+# pixiv_downloader、token_helper 以及它们依赖的 requests/pixivpy3 不在这里导入：
+# 窗口显示后由 preload_modules() 在后台线程中预先导入，第一次点击下载或验证时已经加载完毕
 
+# 窗口显示后多久开始后台预加载，避免与首次绘制争抢 GIL
+PRELOAD_DELAY_MS = 300
+# 日志窗口最多保留的行数，超出后丢弃最早的行
+LOG_MAX_LINES = 5000
+# 日志刷新到界面的间隔（约 30 帧/秒）
+LOG_FLUSH_INTERVAL_MS = 33
+LOG_FILE = Path("logs") / "quickpixiv.log"
+# 进度条中实时下载速度的刷新间隔
+THROUGHPUT_INTERVAL_MS = 1000
+PROGRESS_FORMAT = "已下载: %v / %m"
+
+
+class LogBuffer:
+    """线程安全的日志缓冲区
+
+    任意线程调用 append() 写入，GUI 线程的定时器按固定帧率 drain() 后一次性追加到日志窗口，
+    避免每条日志都触发一次界面重排。界面长时间未刷新时只保留最新的 maxlen 条。
+    启用日志文件时，每条日志都会在写入线程中同时写入滚动日志文件。
+    """
+
+    def __init__(self, maxlen=LOG_MAX_LINES):
+        self._lines = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+        self._file_logger = logging.getLogger("quickpixiv")
+        self._file_logger.setLevel(logging.INFO)
+        self._file_logger.propagate = False
+        self._file_handler = None
+
+    def append(self, message):
+        with self._lock:
+            self._lines.append(message)
+        if self._file_handler:
+            self._file_logger.info(message)
+
+    def drain(self):
+        with self._lock:
+            lines = list(self._lines)
+            self._lines.clear()
+        return lines
+
+    def set_file_logging(self, enabled, path=LOG_FILE):
+        if enabled and self._file_handler is None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            handler = RotatingFileHandler(path, maxBytes=5 * 1024 * 1024, backupCount=3, encoding='utf-8')
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self._file_logger.addHandler(handler)
+            self._file_handler = handler
+        elif not enabled and self._file_handler is not None:
+            self._file_logger.removeHandler(self._file_handler)
+            self._file_handler.close()
+            self._file_handler = None
+
+
+def split_tags(text):
+    """把逗号（中英文）分隔的标签文本拆成列表"""
+    return [tag.strip() for tag in text.replace('，', ',').split(',') if tag.strip()]
 
 
 class DownloadThread(QThread):
     progress_updated = pyqtSignal(int, int)
-    log_updated = pyqtSignal(str)
     finished = pyqtSignal()
     
-    def __init__(self, downloader, download_type):
+    def __init__(self, downloader, download_type, log_func):
         super().__init__()
         self.downloader = downloader
         self.download_type = download_type
-        self._stop_flag = False
+        self.log_func = log_func
     
     def run(self):
         def progress_callback(current, total):
             self.progress_updated.emit(current, total)
-            if self._stop_flag:
-                raise Exception("下载被用户中断")
         
-        def log_callback(msg):
-            self.log_updated.emit(msg)
-        
-        self.downloader.log_func = log_callback
+        # 日志直接写入缓冲区，由界面定时批量刷新，不再逐条发送信号
+        self.downloader.log_func = self.log_func
         
         try:
             if self.download_type == "recommended":
                 self.downloader.download_recommended(progress_callback)
             elif self.download_type == "following":
                 self.downloader.download_following(progress_callback)
+            elif self.download_type == "failed":
+                self.downloader.download_failed(progress_callback)
         except Exception as e:
-            self.log_updated.emit(f"下载出错: {e}")
+            self.log_func(f"下载出错: {e}")
         finally:
+            self.downloader.close()
             self.finished.emit()
     
     def stop(self):
-        self._stop_flag = True
+        # 取消标记在限速等待、数据块循环和队列等待中检查，无需等到下一个作品完成
+        self.downloader.stop()
 
 class TokenThread(QThread):
     token_updated = pyqtSignal(str, str)  # token, output
@@ -72,6 +132,7 @@ class TokenThread(QThread):
     
     def run(self):
         if self.action == "verify":
+            from token_helper import verify_token
             token, output = verify_token(self.token)
             self.token_updated.emit(token, output)
 
@@ -81,8 +142,18 @@ class PixivDownloaderGUI(QMainWindow):
         self.download_thread = None
         self.token_thread = None
         self.settings = QSettings("PixivDownloader", "GUI")
+        self.log_buffer = LogBuffer()
+        # 带宽和每主机连接数上限，各次下载共用，调整设置时对正在进行的下载立即生效
+        self.transfer_limiter = TransferLimiter()
         self.init_ui()
         self.load_settings()
+        self.log_timer = QTimer(self)
+        self.log_timer.setInterval(LOG_FLUSH_INTERVAL_MS)
+        self.log_timer.timeout.connect(self.flush_log)
+        self.log_timer.start()
+        self.throughput_timer = QTimer(self)
+        self.throughput_timer.setInterval(THROUGHPUT_INTERVAL_MS)
+        self.throughput_timer.timeout.connect(self.update_throughput)
     
     def init_ui(self):
         self.setWindowIcon(QIcon(str(Path("1.ico").absolute())))
@@ -192,17 +263,204 @@ class PixivDownloaderGUI(QMainWindow):
         self.delay.setSingleStep(100)
         self.delay.setSuffix(" ms")
         self.delay.setKeyboardTracking(True)
+        self.delay.setToolTip("API请求之间的平均间隔，允许少量突发；被限流时会自动降速")
         self.delay.valueChanged.connect(self.save_settings)
         settings_layout.addWidget(self.delay, 6, 1)
         
+        # 图片请求速率
+        settings_layout.addWidget(QLabel("图片请求速率(次/秒):"), 7, 0)
+        self.cdn_rate = QSpinBox()
+        self.cdn_rate.setRange(0, 100)
+        self.cdn_rate.setValue(10)
+        self.cdn_rate.setSingleStep(1)
+        self.cdn_rate.setSpecialValueText("不限")
+        self.cdn_rate.setKeyboardTracking(True)
+        self.cdn_rate.valueChanged.connect(self.save_settings)
+        settings_layout.addWidget(self.cdn_rate, 7, 1)
+        
+        # 并发下载数
+        settings_layout.addWidget(QLabel("并发下载数:"), 8, 0)
+        self.download_workers = QSpinBox()
+        self.download_workers.setRange(1, 16)
+        self.download_workers.setValue(4)
+        self.download_workers.setSingleStep(1)
+        self.download_workers.setKeyboardTracking(True)
+        self.download_workers.valueChanged.connect(self.save_settings)
+        settings_layout.addWidget(self.download_workers, 8, 1)
+        
+        # 下载引擎
+        settings_layout.addWidget(QLabel("下载引擎:"), 9, 0)
+        self.engine = QComboBox()
+        self.engine.addItems(["threaded", "asyncio"])
+        self.engine.setToolTip("threaded: 多线程下载；asyncio: 单线程异步下载（需要 aiohttp）")
+        self.engine.currentTextChanged.connect(self.save_settings)
+        settings_layout.addWidget(self.engine, 9, 1)
+        
+        # 每位关注画师遍历的作品数
+        settings_layout.addWidget(QLabel("每位画师作品数:"), 10, 0)
+        self.following_depth = QSpinBox()
+        self.following_depth.setRange(1, 1000)
+        self.following_depth.setValue(5)
+        self.following_depth.setSingleStep(1)
+        self.following_depth.setKeyboardTracking(True)
+        self.following_depth.valueChanged.connect(self.save_settings)
+        settings_layout.addWidget(self.following_depth, 10, 1)
+        
+        # 同时获取作品列表的画师数
+        settings_layout.addWidget(QLabel("画师并发数:"), 11, 0)
+        self.following_fanout = QSpinBox()
+        self.following_fanout.setRange(1, 16)
+        self.following_fanout.setValue(4)
+        self.following_fanout.setSingleStep(1)
+        self.following_fanout.setKeyboardTracking(True)
+        self.following_fanout.valueChanged.connect(self.save_settings)
+        settings_layout.addWidget(self.following_fanout, 11, 1)
+        
+        # API缓存有效期
+        settings_layout.addWidget(QLabel("API缓存有效期:"), 12, 0)
+        self.cache_ttl = QSpinBox()
+        self.cache_ttl.setRange(0, 1440)
+        self.cache_ttl.setValue(30)
+        self.cache_ttl.setSingleStep(10)
+        self.cache_ttl.setSuffix(" 分钟")
+        self.cache_ttl.setSpecialValueText("关闭")
+        self.cache_ttl.setToolTip("有效期内重复运行（如调低筛选条件）直接使用缓存的作品信息，不再请求API")
+        self.cache_ttl.setKeyboardTracking(True)
+        self.cache_ttl.valueChanged.connect(self.save_settings)
+        settings_layout.addWidget(self.cache_ttl, 12, 1)
+        
         # 多页仅下载单页
         self.single_page_only = QCheckBox("多页仅下载单页")
         self.single_page_only.setToolTip("勾选后，多页作品只下载第一页；不勾选则下载所有页面")
         self.single_page_only.toggled.connect(self.save_settings)
-        settings_layout.addWidget(self.single_page_only, 7, 0, 1, 2)
+        settings_layout.addWidget(self.single_page_only, 13, 0, 1, 2)
+        
+        # 关注画师增量同步
+        self.incremental = QCheckBox("关注画师增量同步")
+        self.incremental.setChecked(True)
+        self.incremental.setToolTip("勾选后，每位画师只检查上次同步之后的新作品；不勾选则每次都检查最新作品")
+        self.incremental.toggled.connect(self.save_settings)
+        settings_layout.addWidget(self.incremental, 14, 0, 1, 2)
+        
+        # 相同图片去重
+        self.dedup = QCheckBox("相同图片硬链接去重")
+        self.dedup.setChecked(True)
+        self.dedup.setToolTip("勾选后，内容与已下载文件完全相同的图片（重复上传、转载等）以硬链接保存，只占用一份磁盘空间")
+        self.dedup.toggled.connect(self.save_settings)
+        settings_layout.addWidget(self.dedup, 15, 0, 1, 2)
+        
+        # 动图格式
+        settings_layout.addWidget(QLabel("动图格式:"), 16, 0)
+        self.ugoira_format = QComboBox()
+        self.ugoira_format.addItems(["webp", "gif", "apng"])
+        self.ugoira_format.setToolTip("ugoira 动图合成的格式；webp 逐帧编码，体积最小且占用内存最少")
+        self.ugoira_format.currentTextChanged.connect(self.save_settings)
+        settings_layout.addWidget(self.ugoira_format, 16, 1)
+        
+        # 大文件分段下载
+        settings_layout.addWidget(QLabel("分段下载阈值:"), 17, 0)
+        self.segment_threshold = QSpinBox()
+        self.segment_threshold.setRange(0, 500)
+        self.segment_threshold.setValue(0)
+        self.segment_threshold.setSuffix(" MB")
+        self.segment_threshold.setSpecialValueText("关闭")
+        self.segment_threshold.setToolTip("不小于此大小的原图拆成4段并发下载，适合高延迟网络；0为关闭")
+        self.segment_threshold.setKeyboardTracking(True)
+        self.segment_threshold.valueChanged.connect(self.save_settings)
+        settings_layout.addWidget(self.segment_threshold, 17, 1)
+        
+        # 文件路径模板
+        settings_layout.addWidget(QLabel("目录布局:"), 18, 0)
+        self.path_template = QComboBox()
+        self.path_template.setEditable(True)
+        self.path_template.addItems(["flat", "artist", "id_prefix", "shard", "date"])
+        self.path_template.setToolTip("文件在下载目录中的存放方式：flat 全部平铺，artist 按画师ID分目录，"
+                                      "id_prefix/shard 按作品ID分目录，date 按发布年月分目录；\n"
+                                      "也可输入自定义模板，如 {user_id}/{user}_{title}_{id}{page}.{ext}。"
+                                      "已下载的文件可用 migrate_layout.py 迁移到新布局")
+        self.path_template.currentTextChanged.connect(self.save_settings)
+        settings_layout.addWidget(self.path_template, 18, 1)
+        
+        # 全局带宽上限
+        settings_layout.addWidget(QLabel("带宽上限:"), 19, 0)
+        self.bandwidth_limit = QSpinBox()
+        self.bandwidth_limit.setRange(0, 1024 * 1024)
+        self.bandwidth_limit.setValue(0)
+        self.bandwidth_limit.setSingleStep(256)
+        self.bandwidth_limit.setSuffix(" KB/s")
+        self.bandwidth_limit.setSpecialValueText("不限")
+        self.bandwidth_limit.setToolTip("所有下载线程合计的图片下载速度上限；下载过程中修改立即生效")
+        self.bandwidth_limit.setKeyboardTracking(False)
+        self.bandwidth_limit.valueChanged.connect(self.apply_transfer_limits)
+        self.bandwidth_limit.valueChanged.connect(self.save_settings)
+        settings_layout.addWidget(self.bandwidth_limit, 19, 1)
+        
+        # 每主机连接数上限
+        settings_layout.addWidget(QLabel("每主机连接数:"), 20, 0)
+        self.host_connections = QSpinBox()
+        self.host_connections.setRange(0, 64)
+        self.host_connections.setValue(0)
+        self.host_connections.setSpecialValueText("不限")
+        self.host_connections.setToolTip("对同一图片服务器同时进行的请求数上限（含分段下载）；下载过程中修改立即生效")
+        self.host_connections.setKeyboardTracking(False)
+        self.host_connections.valueChanged.connect(self.apply_transfer_limits)
+        self.host_connections.valueChanged.connect(self.save_settings)
+        settings_layout.addWidget(self.host_connections, 20, 1)
         
         layout.addWidget(settings_group)
         
+        # 高级筛选组
+        filter_group = QGroupBox("高级筛选")
+        filter_layout = QGridLayout(filter_group)
+        
+        # 包含标签
+        filter_layout.addWidget(QLabel("包含标签:"), 0, 0)
+        self.include_tags = QLineEdit()
+        self.include_tags.setPlaceholderText("多个标签用逗号分隔，作品含任一标签才下载")
+        self.include_tags.textChanged.connect(self.save_settings)
+        filter_layout.addWidget(self.include_tags, 0, 1)
+        
+        # 排除标签
+        filter_layout.addWidget(QLabel("排除标签:"), 1, 0)
+        self.exclude_tags = QLineEdit()
+        self.exclude_tags.setPlaceholderText("多个标签用逗号分隔，作品含任一标签则跳过")
+        self.exclude_tags.textChanged.connect(self.save_settings)
+        filter_layout.addWidget(self.exclude_tags, 1, 1)
+        
+        # R-18
+        filter_layout.addWidget(QLabel("R-18作品:"), 2, 0)
+        self.r18 = QComboBox()
+        self.r18.addItem("包含", "include")
+        self.r18.addItem("排除", "exclude")
+        self.r18.addItem("仅R-18", "only")
+        self.r18.currentIndexChanged.connect(self.save_settings)
+        filter_layout.addWidget(self.r18, 2, 1)
+        
+        # 作品发布时间
+        filter_layout.addWidget(QLabel("只下载最近:"), 3, 0)
+        self.max_age_days = QSpinBox()
+        self.max_age_days.setRange(0, 3650)
+        self.max_age_days.setValue(0)
+        self.max_age_days.setSuffix(" 天")
+        self.max_age_days.setSpecialValueText("不限")
+        self.max_age_days.setKeyboardTracking(True)
+        self.max_age_days.valueChanged.connect(self.save_settings)
+        filter_layout.addWidget(self.max_age_days, 3, 1)
+        
+        # 被拒比例放弃阈值
+        filter_layout.addWidget(QLabel("放弃阈值:"), 4, 0)
+        self.give_up_reject_rate = QSpinBox()
+        self.give_up_reject_rate.setRange(0, 100)
+        self.give_up_reject_rate.setValue(0)
+        self.give_up_reject_rate.setSuffix(" %")
+        self.give_up_reject_rate.setSpecialValueText("不放弃")
+        self.give_up_reject_rate.setToolTip("最近200个作品中不满足筛选条件的比例达到此值时停止遍历")
+        self.give_up_reject_rate.setKeyboardTracking(True)
+        self.give_up_reject_rate.valueChanged.connect(self.save_settings)
+        filter_layout.addWidget(self.give_up_reject_rate, 4, 1)
+        
+        layout.addWidget(filter_group)
+        
         # 下载按钮组
         download_group = QGroupBox("下载操作")
         download_layout = QHBoxLayout(download_group)
@@ -215,6 +473,10 @@ class PixivDownloaderGUI(QMainWindow):
         self.download_following_btn.clicked.connect(lambda: self.start_download("following"))
         download_layout.addWidget(self.download_following_btn)
         
+        self.download_failed_btn = QPushButton("重试失败作品")
+        self.download_failed_btn.clicked.connect(lambda: self.start_download("failed"))
+        download_layout.addWidget(self.download_failed_btn)
+        
         self.stop_download_btn = QPushButton("打断下载")
         self.stop_download_btn.clicked.connect(self.stop_download)
         self.stop_download_btn.setEnabled(False)
@@ -224,22 +486,33 @@ class PixivDownloaderGUI(QMainWindow):
         
         # 进度条
         self.progress_bar = QProgressBar()
-        self.progress_bar.setFormat("已下载: %v / %m")
+        self.progress_bar.setFormat(PROGRESS_FORMAT)
         layout.addWidget(self.progress_bar)
         
         # 日志输出
         log_group = QGroupBox("日志输出")
         log_layout = QVBoxLayout(log_group)
         
-        self.log_output = QTextEdit()
+        self.log_output = QPlainTextEdit()
         self.log_output.setReadOnly(True)
         self.log_output.setFont(QFont("Consolas", 9))
+        self.log_output.setMaximumBlockCount(LOG_MAX_LINES)
         log_layout.addWidget(self.log_output)
         
+        log_btn_layout = QHBoxLayout()
+        
+        # 保存完整日志到文件
+        self.log_to_file = QCheckBox("保存完整日志到文件")
+        self.log_to_file.setToolTip(f"日志窗口只保留最近 {LOG_MAX_LINES} 行；勾选后完整日志写入 {LOG_FILE}（滚动保存）")
+        self.log_to_file.toggled.connect(self.log_buffer.set_file_logging)
+        self.log_to_file.toggled.connect(self.save_settings)
+        log_btn_layout.addWidget(self.log_to_file)
+        
         # 清空日志按钮
         clear_log_btn = QPushButton("清空日志")
         clear_log_btn.clicked.connect(self.log_output.clear)
-        log_layout.addWidget(clear_log_btn)
+        log_btn_layout.addWidget(clear_log_btn)
+        log_layout.addLayout(log_btn_layout)
         
         layout.addWidget(log_group)
     
@@ -252,7 +525,26 @@ class PixivDownloaderGUI(QMainWindow):
         self.settings.setValue("min_likes", self.min_likes.value())
         self.settings.setValue("image_quality", self.image_quality.currentText())
         self.settings.setValue("delay", self.delay.value())
+        self.settings.setValue("cdn_rate", self.cdn_rate.value())
+        self.settings.setValue("download_workers", self.download_workers.value())
+        self.settings.setValue("engine", self.engine.currentText())
+        self.settings.setValue("following_depth", self.following_depth.value())
+        self.settings.setValue("following_fanout", self.following_fanout.value())
+        self.settings.setValue("cache_ttl", self.cache_ttl.value())
         self.settings.setValue("single_page_only", self.single_page_only.isChecked())
+        self.settings.setValue("incremental", self.incremental.isChecked())
+        self.settings.setValue("dedup", self.dedup.isChecked())
+        self.settings.setValue("ugoira_format", self.ugoira_format.currentText())
+        self.settings.setValue("segment_threshold", self.segment_threshold.value())
+        self.settings.setValue("path_template", self.path_template.currentText())
+        self.settings.setValue("bandwidth_limit", self.bandwidth_limit.value())
+        self.settings.setValue("host_connections", self.host_connections.value())
+        self.settings.setValue("log_to_file", self.log_to_file.isChecked())
+        self.settings.setValue("include_tags", self.include_tags.text())
+        self.settings.setValue("exclude_tags", self.exclude_tags.text())
+        self.settings.setValue("r18", self.r18.currentData())
+        self.settings.setValue("max_age_days", self.max_age_days.value())
+        self.settings.setValue("give_up_reject_rate", self.give_up_reject_rate.value())
         self.settings.sync()  # 强制同步到磁盘
     
     def load_settings(self):
@@ -264,7 +556,26 @@ class PixivDownloaderGUI(QMainWindow):
         min_likes = int(self.settings.value("min_likes", 50))
         image_quality = self.settings.value("image_quality", "original")
         delay = int(self.settings.value("delay", 1000))
+        cdn_rate = int(self.settings.value("cdn_rate", 10))
+        download_workers = int(self.settings.value("download_workers", 4))
+        engine = self.settings.value("engine", "threaded")
+        following_depth = int(self.settings.value("following_depth", 5))
+        following_fanout = int(self.settings.value("following_fanout", 4))
+        cache_ttl = int(self.settings.value("cache_ttl", 30))
         single_page_only = self.settings.value("single_page_only", False, type=bool)
+        incremental = self.settings.value("incremental", True, type=bool)
+        dedup = self.settings.value("dedup", True, type=bool)
+        ugoira_format = self.settings.value("ugoira_format", "webp")
+        segment_threshold = int(self.settings.value("segment_threshold", 0))
+        path_template = self.settings.value("path_template", "flat")
+        bandwidth_limit = int(self.settings.value("bandwidth_limit", 0))
+        host_connections = int(self.settings.value("host_connections", 0))
+        log_to_file = self.settings.value("log_to_file", False, type=bool)
+        include_tags = self.settings.value("include_tags", "")
+        exclude_tags = self.settings.value("exclude_tags", "")
+        r18 = self.settings.value("r18", "include")
+        max_age_days = int(self.settings.value("max_age_days", 0))
+        give_up_reject_rate = int(self.settings.value("give_up_reject_rate", 0))
         
         self.token_input.setText(token)
         self.download_path_input.setText(download_path)
@@ -274,10 +585,37 @@ class PixivDownloaderGUI(QMainWindow):
         self.min_likes.setValue(min_likes)
         self.image_quality.setCurrentText(image_quality)
         self.delay.setValue(delay)
+        self.cdn_rate.setValue(cdn_rate)
+        self.download_workers.setValue(download_workers)
+        self.engine.setCurrentText(engine)
+        self.following_depth.setValue(following_depth)
+        self.following_fanout.setValue(following_fanout)
+        self.cache_ttl.setValue(cache_ttl)
         self.single_page_only.setChecked(single_page_only)
+        self.incremental.setChecked(incremental)
+        self.dedup.setChecked(dedup)
+        self.ugoira_format.setCurrentText(ugoira_format)
+        self.segment_threshold.setValue(segment_threshold)
+        self.path_template.setCurrentText(path_template)
+        self.bandwidth_limit.setValue(bandwidth_limit)
+        self.host_connections.setValue(host_connections)
+        self.apply_transfer_limits()
+        self.log_to_file.setChecked(log_to_file)
+        self.include_tags.setText(include_tags)
+        self.exclude_tags.setText(exclude_tags)
+        self.r18.setCurrentIndex(max(0, self.r18.findData(r18)))
+        self.max_age_days.setValue(max_age_days)
+        self.give_up_reject_rate.setValue(give_up_reject_rate)
     
     def log(self, message):
-        self.log_output.append(f"[{QApplication.instance().applicationName()}] {message}")
+        self.log_buffer.append(message)
+    
+    def flush_log(self):
+        lines = self.log_buffer.drain()
+        if not lines:
+            return
+        prefix = f"[{QApplication.instance().applicationName()}] "
+        self.log_output.appendPlainText("\n".join(prefix + line for line in lines))
         self.log_output.moveCursor(QTextCursor.MoveOperation.End)
     
     def open_gppt_window(self):
@@ -336,7 +674,16 @@ class PixivDownloaderGUI(QMainWindow):
             QMessageBox.warning(self, "警告", "请设置下载目录")
             return
         
+        from path_template import PathTemplate
+        path_template = self.path_template.currentText().strip() or "flat"
+        try:
+            PathTemplate(path_template)
+        except ValueError as e:
+            QMessageBox.warning(self, "警告", f"目录布局模板无效: {e}")
+            return
+        
         # 创建下载器
+        from pixiv_downloader import PixivDownloader
         downloader = PixivDownloader(
             refresh_token=token,
             download_path=download_path,
@@ -347,20 +694,38 @@ class PixivDownloaderGUI(QMainWindow):
             following_limit=self.following_limit.value(),
             delay=self.delay.value() / 1000.0,  # 将毫秒转换为秒
             single_page_only=self.single_page_only.isChecked(),  # 添加多页仅下载单页设置
+            download_workers=self.download_workers.value(),
+            cdn_rate=self.cdn_rate.value(),
+            engine=self.engine.currentText(),
+            following_depth=self.following_depth.value(),
+            following_fanout=self.following_fanout.value(),
+            incremental=self.incremental.isChecked(),
+            dedup=self.dedup.isChecked(),
+            ugoira_format=self.ugoira_format.currentText(),
+            segment_threshold=self.segment_threshold.value() * 1024 * 1024,
+            path_template=path_template,
+            transfer_limiter=self.transfer_limiter,
+            cache_ttl=self.cache_ttl.value() * 60,
+            include_tags=split_tags(self.include_tags.text()),
+            exclude_tags=split_tags(self.exclude_tags.text()),
+            r18=self.r18.currentData(),
+            max_age_days=self.max_age_days.value() or None,
+            give_up_reject_rate=self.give_up_reject_rate.value() / 100 or None,
             log_func=self.log
         )
         
         # 禁用下载按钮
         self.download_recommended_btn.setEnabled(False)
         self.download_following_btn.setEnabled(False)
+        self.download_failed_btn.setEnabled(False)
         self.stop_download_btn.setEnabled(True)
         
         # 启动下载线程
-        self.download_thread = DownloadThread(downloader, download_type)
+        self.download_thread = DownloadThread(downloader, download_type, self.log_buffer.append)
         self.download_thread.progress_updated.connect(self.update_progress)
-        self.download_thread.log_updated.connect(self.log)
         self.download_thread.finished.connect(self.on_download_finished)
         self.download_thread.start()
+        self.throughput_timer.start()
     
     def stop_download(self):
         if self.download_thread:
@@ -372,13 +737,35 @@ class PixivDownloaderGUI(QMainWindow):
         self.progress_bar.setMaximum(total)
         self.progress_bar.setValue(current)
     
+    def apply_transfer_limits(self):
+        self.transfer_limiter.set_limits(self.bandwidth_limit.value() * 1024, self.host_connections.value())
+    
+    def update_throughput(self):
+        rate = format_rate(self.transfer_limiter.throughput())
+        self.progress_bar.setFormat(f"{PROGRESS_FORMAT}    {rate}")
+    
     def on_download_finished(self):
         self.download_recommended_btn.setEnabled(True)
         self.download_following_btn.setEnabled(True)
+        self.download_failed_btn.setEnabled(True)
         self.stop_download_btn.setEnabled(False)
+        self.throughput_timer.stop()
+        self.progress_bar.setFormat(PROGRESS_FORMAT)
         self.progress_bar.setValue(0)
         self.log("下载完成！")
 
+def preload_modules():
+    """在后台线程中导入下载相关模块；失败时不处理，真正用到时会再次导入并报告错误"""
+    def load():
+        try:
+            import pixiv_downloader
+            import token_helper
+            import requests
+            import pixivpy3
+        except Exception:
+            pass
+    threading.Thread(target=load, name="preload", daemon=True).start()
+
 def main():
     
     app = QApplication(sys.argv)
@@ -386,6 +773,7 @@ def main():
     
     window = PixivDownloaderGUI()
     window.show()
+    QTimer.singleShot(PRELOAD_DELAY_MS, preload_modules)
     
     sys.exit(app.exec())
 
@@ -0,0 +1,197 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+
+# 直方图桶上限（秒），与 Prometheus 默认桶相近，补充了较长的区间
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float('inf'))
+
+# 各阶段在汇总中显示的名称
+STAGE_NAMES = {
+    'auth': '登录认证',
+    'api_wait': 'API限速等待',
+    'api_page': 'API元数据请求',
+    'cdn_wait': '图片限速等待',
+    'host_wait': '主机连接数等待',
+    'bandwidth_wait': '带宽上限等待',
+    'request': '连接与首字节',
+    'transfer': '数据传输',
+    'disk_write': '磁盘写入',
+    'ledger_commit': '记录提交',
+    'ugoira_encode': '动图合成',
+}
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+    def copy(self):
+        histogram = Histogram()
+        histogram.counts = list(self.counts)
+        histogram.count = self.count
+        histogram.sum = self.sum
+        return histogram
+
+    def since(self, earlier):
+        """返回 earlier（同一直方图之前的副本）之后新增的观测"""
+        if earlier is None:
+            return self.copy()
+        histogram = Histogram()
+        histogram.counts = [now - before for now, before in zip(self.counts, earlier.counts)]
+        histogram.count = self.count - earlier.count
+        histogram.sum = self.sum - earlier.sum
+        return histogram
+
+    def quantile(self, q):
+        """按桶估算分位数，返回所在桶的上限"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return BUCKETS[-1]
+
+
+class Metrics:
+    """下载各阶段的计数器与耗时直方图
+
+    可选把每次观测写入 JSON Lines 文件，或通过 HTTP 以 Prometheus 文本格式暴露（/metrics）。
+    """
+
+    def __init__(self, jsonl_path=None, port=None):
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self._jsonl = open(jsonl_path, 'a', encoding='utf-8') if jsonl_path else None
+        self._httpd = None
+        if port:
+            self.serve(port)
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        self._emit({'counter': name, 'value': value})
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+        self._emit({'stage': stage, 'seconds': round(seconds, 6)})
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def _emit(self, event):
+        if self._jsonl is None:
+            return
+        event['ts'] = round(time.time(), 3)
+        line = json.dumps(event) + '\n'
+        with self._lock:
+            self._jsonl.write(line)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def snapshot(self):
+        """返回当前计数和直方图的副本，传给 summary_lines() 只汇总之后的部分"""
+        with self._lock:
+            return dict(self.counters), {stage: h.copy() for stage, h in self.histograms.items()}
+
+    def summary_lines(self, since=None):
+        """运行结束时输出的汇总，按总耗时从高到低排列各阶段
+
+        守护模式的多次同步和多个账号可能共用一份统计，since 为本次运行开始时的 snapshot()，
+        只汇总本次运行新增的部分；Prometheus 输出的计数不受影响，仍然持续累加。
+        """
+        with self._lock:
+            counters, histograms = self.counters, self.histograms
+            if since is not None:
+                counters = {name: value - since[0].get(name, 0) for name, value in counters.items()}
+                histograms = {stage: h.since(since[1].get(stage)) for stage, h in histograms.items()}
+            stages = sorted(((name, h) for name, h in histograms.items() if h.count),
+                            key=lambda item: item[1].sum, reverse=True)
+            counters = sorted((name, value) for name, value in counters.items() if value)
+            lines = ["各阶段耗时统计:"]
+            for name, h in stages:
+                lines.append(f"  {STAGE_NAMES.get(name, name)}: {h.count} 次, 总计 {h.sum:.2f}s, "
+                             f"平均 {h.sum / h.count * 1000:.1f}ms, p50≤{h.quantile(0.5):g}s, p99≤{h.quantile(0.99):g}s")
+            if counters:
+                lines.append("计数: " + ", ".join(f"{name}={value}" for name, value in counters))
+        return lines
+
+    def prometheus_text(self):
+        out = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                out.append(f"# TYPE quickpixiv_{name}_total counter")
+                out.append(f"quickpixiv_{name}_total {value}")
+            if self.histograms:
+                out.append("# TYPE quickpixiv_stage_seconds histogram")
+            for stage, h in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS, h.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                    out.append(f'quickpixiv_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+                out.append(f'quickpixiv_stage_seconds_sum{{stage="{stage}"}} {h.sum}')
+                out.append(f'quickpixiv_stage_seconds_count{{stage="{stage}"}} {h.count}')
+        return '\n'.join(out) + '\n'
+
+    def serve(self, port, host='127.0.0.1'):
+        # 只有启用 /metrics 时才需要 http.server，避免拖慢启动
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+        if self._jsonl:
+            with self._lock:
+                self._jsonl.close()
+                self._jsonl = None
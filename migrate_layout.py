@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+下载目录布局迁移工具
+
+把已下载的文件按新的路径模板移动到分目录的布局中（例如从全部平铺改为按画师ID或作品ID分目录），
+并同步更新下载记录中的文件路径。文件在同一分区内重命名，硬链接去重的文件移动后仍共享数据。
+
+请在下载器未运行时执行，并在与下载时相同的工作目录中运行（下载记录中可能保存的是相对路径）。
+
+用法:
+    python migrate_layout.py -o ./downloads --template artist --dry-run
+    python migrate_layout.py -o ./downloads --template shard --workers 8
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from download_ledger import DownloadLedger
+from path_template import PRESETS, PathTemplate
+
+
+# 旧版本（没有按页记录时）下载的平铺文件: ..._{作品ID}[_p{页码}].{扩展名}
+ORPHAN_PATTERN = re.compile(r'_(\d+)(?:_p(\d+))?\.(\w+)$')
+# 每移动这么多个文件输出一次进度
+PROGRESS_EVERY = 500
+# 没有画师名和标题的记录只能保留原文件名，目录部分不能用到这些字段
+_METADATA_FIELDS = {'user', 'title'}
+
+
+def log(msg):
+    print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {msg}", flush=True)
+
+
+def source_root(path, old_template):
+    """按旧模板的目录层数求出文件所在的下载目录，路径写法（相对或绝对）与记录中的保持一致"""
+    return path.parents[len(old_template.components) - 1]
+
+
+def is_multi_page(name, illust_id, page, pages):
+    return bool(pages and pages > 1) or f"_{illust_id}_p{page}." in name
+
+
+def plan_moves(ledger, download_path, old_template, new_template):
+    """返回 [(旧路径, 新路径), ...] 和跳过的文件数"""
+    moves = []
+    skipped = 0
+    targets = set()
+    recorded = set()
+
+    def add(source, target):
+        nonlocal skipped
+        if target in targets:
+            log(f"目标路径重复，跳过: {source}")
+            skipped += 1
+            return
+        targets.add(target)
+        if source != target:
+            moves.append((source, target))
+
+    for illust_id, page, stored, user_id, user_name, title, pages in ledger.page_rows():
+        path = Path(stored)
+        recorded.add(os.path.normcase(os.path.abspath(path)))
+        if not path.is_file():
+            skipped += 1
+            continue
+        if user_name is None or title is None:
+            # 从旧版文本记录迁移来的作品没有画师名和标题
+            target = directory_only_target(new_template, path, illust_id, page, user_id)
+            if target is None:
+                skipped += 1
+                continue
+            add(path, source_root(path, old_template) / target)
+            continue
+        values = new_template.values(illust_id, user_id, user_name, title, page,
+                                     is_multi_page(path.name, illust_id, page, pages), path.suffix[1:])
+        add(path, source_root(path, old_template) / new_template.render_values(values))
+
+    # 下载记录中没有的旧文件只在下载目录顶层查找
+    for entry in os.scandir(download_path):
+        match = ORPHAN_PATTERN.search(entry.name)
+        if not match or not entry.is_file() or os.path.normcase(os.path.abspath(entry.path)) in recorded:
+            continue
+        path = Path(entry.path)
+        illust_id, page = int(match.group(1)), int(match.group(2) or 0)
+        info = ledger.get(illust_id) or {}
+        if info.get('user_name') is not None and info.get('title') is not None:
+            values = new_template.values(illust_id, info['user_id'], info['user_name'], info['title'], page,
+                                         match.group(2) is not None, match.group(3))
+            add(path, download_path / new_template.render_values(values))
+            continue
+        target = directory_only_target(new_template, path, illust_id, page, info.get('user_id'))
+        if target is None:
+            skipped += 1
+            continue
+        add(path, download_path / target)
+    return moves, skipped
+
+
+def directory_only_target(template, path, illust_id, page, user_id):
+    """没有作品信息时保留原文件名，只按模板的目录部分放置；目录部分需要缺失的信息时返回 None"""
+    directory_fields = {field for parts in template.components[:-1] for _, field, _ in parts if field}
+    if directory_fields & _METADATA_FIELDS or ('user_id' in directory_fields and user_id is None):
+        return None
+    values = template.values(illust_id, user_id, '', '', page, False, path.suffix[1:])
+    return template.render_values(values).parent / path.name
+
+
+def move(source, target):
+    """移动单个文件，返回是否移动成功；目标已存在且不是同一文件时不覆盖"""
+    try:
+        if target.exists() and not os.path.samefile(source, target):
+            log(f"目标已存在，跳过: {target}")
+            return False
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(source, target)
+        return True
+    except OSError as e:
+        log(f"移动失败 {source}: {e}")
+        return False
+
+
+def remove_empty_dirs(directories, download_path):
+    """删除移动后留下的空目录，自下而上，不删除下载目录本身"""
+    root = os.path.abspath(download_path) + os.sep
+    for directory in sorted(directories, key=lambda d: len(str(d)), reverse=True):
+        current = directory
+        while os.path.abspath(current).startswith(root):
+            try:
+                current.rmdir()
+            except OSError:
+                break
+            current = current.parent
+
+
+def migrate(download_path, template, old_template='flat', workers=8, dry_run=False, ledger_path=None):
+    """执行迁移，返回 (移动的文件数, 跳过的文件数)"""
+    download_path = Path(download_path)
+    new_template = PathTemplate(template)
+    old_template = PathTemplate(old_template)
+    if new_template.needs_date:
+        # 下载记录中没有保存作品的发布日期
+        raise SystemExit("迁移不支持使用 {date}/{year}/{month} 的模板，这些字段只在下载新作品时可用")
+    if not download_path.is_dir():
+        raise SystemExit(f"下载目录不存在: {download_path}")
+    ledger = DownloadLedger(ledger_path or download_path / 'downloads.db')
+    try:
+        moves, skipped = plan_moves(ledger, download_path, old_template, new_template)
+        log(f"共 {len(moves)} 个文件需要移动，{skipped} 个文件跳过")
+        if dry_run:
+            for source, target in moves[:20]:
+                log(f"{source} -> {target}")
+            return 0, skipped
+
+        moved = {}
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for (source, target), ok in zip(moves, pool.map(lambda m: move(*m), moves)):
+                if not ok:
+                    skipped += 1
+                    continue
+                moved[str(source)] = target
+                if len(moved) % PROGRESS_EVERY == 0:
+                    log(f"已移动 {len(moved)}/{len(moves)} 个文件")
+        # 下载器按模板路径判断文件是否已下载，记录中的路径用于去重查找；全部移动完后在一个事务中更新
+        ledger.rename_paths(moved)
+    finally:
+        ledger.close()
+    remove_empty_dirs({Path(source).parent for source in moved}, download_path)
+    log(f"迁移完成：移动 {len(moved)} 个文件，跳过 {skipped} 个")
+    return len(moved), skipped
+
+
+def build_parser():
+    presets = ', '.join(f"{name}={template}" for name, template in PRESETS.items())
+    parser = argparse.ArgumentParser(description="把已下载的文件移动到新的目录布局并更新下载记录")
+    parser.add_argument('-o', '--download-path', dest='download_path', default='./downloads', help="下载目录")
+    parser.add_argument('--template', required=True, help=f"新的路径模板，可用预设: {presets}")
+    parser.add_argument('--from', dest='old_template', default='flat', help="当前使用的路径模板，默认为 flat")
+    parser.add_argument('--ledger', help="下载记录文件，默认为下载目录下的 downloads.db")
+    parser.add_argument('--workers', type=int, default=8, help="并行移动文件的线程数")
+    parser.add_argument('--dry-run', action='store_true', help="只显示将要移动的文件，不实际移动")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        migrate(args.download_path, args.template, args.old_template, args.workers, args.dry_run, args.ledger)
+    except ValueError as e:
+        log(str(e))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
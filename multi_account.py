@@ -0,0 +1,81 @@
+import threading
+from pathlib import Path
+
+from cancel import CancelToken
+from download_ledger import DownloadLedger
+from pixiv_downloader import PixivDownloader, connection_pool_size, create_session
+from rate_limiter import TransferLimiter
+
+
+class MultiAccountSync:
+    """多账号并行同步
+
+    每个账号一个 PixivDownloader，各自使用自己的 refresh_token、限速设置和下载目录，在独立线程中运行；
+    所有账号共用一份下载记录、一个 HTTP 连接池，以及同一组带宽和每主机连接数上限（transfer_limiter）。
+    作品开始下载前在下载记录中登记，同一作品出现在多个账号的列表中时只由先登记的账号下载一次，文件保存在该账号的目录中。
+
+    accounts 为 [(账号名, PixivDownloader 参数字典), ...]，参数中不需要 ledger/session/cancel_token/transfer_limiter/log_func。
+    """
+
+    def __init__(self, accounts, ledger_path, cancel_token=None, metrics=None, transfer_limiter=None, log_func=None):
+        self.cancel_token = cancel_token or CancelToken()
+        self.transfer_limiter = transfer_limiter or TransferLimiter()
+        self.log_func = log_func or print
+        Path(ledger_path).parent.mkdir(parents=True, exist_ok=True)
+        self.ledger = DownloadLedger(Path(ledger_path))
+        pool_size = sum(connection_pool_size(kwargs.get('download_workers', 4), kwargs.get('segment_threshold', 0),
+                                             kwargs.get('segments', 4))
+                        for _, kwargs in accounts)
+        max_retries = max(kwargs.get('max_retries', 3) for _, kwargs in accounts)
+        self.session = create_session(pool_size, max_retries)
+        # metrics 为 None 时每个账号单独统计
+        self.downloaders = {}
+        for name, kwargs in accounts:
+            self.downloaders[name] = PixivDownloader(ledger=self.ledger, session=self.session,
+                                                     cancel_token=self.cancel_token, metrics=metrics,
+                                                     transfer_limiter=self.transfer_limiter,
+                                                     log_func=self._account_log(name), **kwargs)
+
+    def _account_log(self, name):
+        return lambda msg: self.log_func(f"[{name}] {msg}")
+
+    def run(self, mode='all', progress_callback=None):
+        """所有账号同时同步，返回 {账号名: 下载的作品数}
+
+        progress_callback(账号名, 当前数, 总数) 在各账号的线程中调用。
+        """
+        results = {}
+        threads = [threading.Thread(target=self._sync_account, args=(name, mode, progress_callback, results),
+                                    name=f"account-{name}")
+                   for name in self.downloaders]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def _sync_account(self, name, mode, progress_callback, results):
+        downloader = self.downloaders[name]
+        callback = None
+        if progress_callback:
+            callback = lambda current, total: progress_callback(name, current, total)
+        total = 0
+        try:
+            if mode in ('all', 'recommended'):
+                total += downloader.download_recommended(callback)
+            if mode in ('all', 'following') and not self.cancel_token.cancelled:
+                total += downloader.download_following(callback)
+            if mode == 'failed':
+                total += downloader.download_failed(callback)
+        except Exception as e:
+            downloader.log(f"同步出错: {e}")
+        results[name] = total
+
+    def stop(self):
+        self.cancel_token.cancel()
+
+    def close(self):
+        for downloader in self.downloaders.values():
+            downloader.close()
+        self.ledger.close()
+        self.session.close()
@@ -0,0 +1,144 @@
+import re
+import string
+from pathlib import PurePosixPath
+
+
+# 文件名中不允许出现的字符（Windows 保留字符和控制字符），替换为下划线
+_UNSAFE_CHARS = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+
+# 单个路径部分（目录名或文件名）的最大字节数；ext4/NTFS 上限为 255，给 .part/.seg/.link 临时后缀留出余量
+MAX_COMPONENT_BYTES = 240
+
+# 预设布局，也可以直接传入自定义模板；模板中的 / 分隔目录
+PRESETS = {
+    # 全部放在下载目录下（原有布局）
+    'flat': '{user}_{title}_{id}{page}.{ext}',
+    # 按画师ID分目录
+    'artist': '{user_id}/{user}_{title}_{id}{page}.{ext}',
+    # 按作品ID前缀（每一百万个ID）分目录，新作品集中在最新的几个目录中
+    'id_prefix': '{id_prefix}/{user}_{title}_{id}{page}.{ext}',
+    # 按作品ID散列到 256 个目录，各目录文件数均匀
+    'shard': '{shard}/{user}_{title}_{id}{page}.{ext}',
+    # 按发布年月分目录
+    'date': '{year}/{month}/{user}_{title}_{id}{page}.{ext}',
+}
+
+FIELDS = {
+    'id': "作品ID",
+    'user_id': "画师ID",
+    'user': "画师名",
+    'title': "作品标题",
+    'page': "多页作品为 _p页码，单页作品为空",
+    'p': "页码（从0开始）",
+    'ext': "扩展名",
+    'id_prefix': "作品ID除以一百万，补足3位",
+    'shard': "作品ID除以256的余数，2位十六进制",
+    'date': "发布日期 YYYY-MM-DD",
+    'year': "发布年份",
+    'month': "发布月份",
+}
+# 需要作品发布日期的字段，下载记录中没有保存发布日期
+DATE_FIELDS = frozenset(('date', 'year', 'month'))
+# 超出长度时依次截短的字段
+_SHRINKABLE = ('title', 'user')
+
+
+def sanitize(value):
+    return _UNSAFE_CHARS.sub('_', str(value))
+
+
+def truncate_bytes(text, max_bytes):
+    """按 UTF-8 字节数截断，不会截断到多字节字符的中间"""
+    data = text.encode('utf-8')
+    if len(data) <= max_bytes:
+        return text
+    return data[:max(0, max_bytes)].decode('utf-8', 'ignore')
+
+
+class PathTemplate:
+    """作品文件的相对路径模板
+
+    模板在创建时解析为按目录拆分的片段列表，render() 只做字段替换和拼接。
+    字段值中的非法字符替换为下划线；某一级目录名或文件名超过 max_component_bytes 字节时，
+    先截短标题、再截短画师名，作品ID和扩展名始终保留。
+    """
+
+    def __init__(self, template='flat', max_component_bytes=MAX_COMPONENT_BYTES):
+        self.template = PRESETS.get(template, template)
+        self.max_component_bytes = max_component_bytes
+        self.components = []
+        self.fields = set()
+        for component in self.template.split('/'):
+            if component in ('', '.', '..'):
+                raise ValueError(f"路径模板中有空的或相对的目录: {self.template}")
+            parts = []
+            for literal, field, spec, conversion in string.Formatter().parse(component):
+                if field is not None and field not in FIELDS:
+                    raise ValueError(f"路径模板中有未知字段 {{{field}}}，可用字段: {', '.join(FIELDS)}")
+                parts.append((literal, field, spec or ''))
+                if field:
+                    self.fields.add(field)
+            self.components.append(parts)
+        if 'id' not in self.fields:
+            raise ValueError("路径模板必须包含 {id}，否则不同作品的文件会互相覆盖")
+
+    @property
+    def needs_date(self):
+        return bool(self.fields & DATE_FIELDS)
+
+    def values(self, illust_id, user_id, user_name, title, page=0, multi_page=False, ext='jpg', create_date=None):
+        illust_id = int(illust_id)
+        date = (create_date or '')[:10]
+        return {
+            'id': illust_id,
+            'user_id': user_id if user_id is not None else 'unknown',
+            'user': sanitize(user_name),
+            'title': sanitize(title),
+            'page': f"_p{page}" if multi_page else '',
+            'p': page,
+            'ext': ext,
+            'id_prefix': f"{illust_id // 1000000:03d}",
+            'shard': f"{illust_id % 256:02x}",
+            'date': date or 'unknown',
+            'year': date[:4] or 'unknown',
+            'month': date[5:7] or 'unknown',
+        }
+
+    def render(self, illust, page=0, multi_page=False, ext='jpg'):
+        """返回作品某一页相对于下载目录的路径"""
+        values = self.values(illust['id'], illust['user'].get('id'), illust['user']['name'], illust['title'],
+                             page, multi_page, ext, illust.get('create_date'))
+        return self.render_values(values)
+
+    def render_values(self, values):
+        last = len(self.components) - 1
+        names = []
+        for index, parts in enumerate(self.components):
+            name = self._render_component(parts, values)
+            if index < last:
+                # Windows 不允许目录名以空格或句点结尾
+                name = name.rstrip(' .') or '_'
+            names.append(name)
+        return PurePosixPath(*names)
+
+    def _render_component(self, parts, values):
+        name = self._join(parts, values)
+        overflow = len(name.encode('utf-8')) - self.max_component_bytes
+        for field in _SHRINKABLE:
+            if overflow <= 0:
+                break
+            occurrences = sum(1 for _, part_field, _ in parts if part_field == field)
+            if not occurrences:
+                continue
+            value = values[field]
+            shorter = truncate_bytes(value, len(value.encode('utf-8')) - -(-overflow // occurrences))
+            values = dict(values, **{field: shorter})
+            name = self._join(parts, values)
+            overflow = len(name.encode('utf-8')) - self.max_component_bytes
+        if overflow > 0:
+            name = truncate_bytes(name, self.max_component_bytes)
+        return name
+
+    @staticmethod
+    def _join(parts, values):
+        return ''.join(literal + (format(values[field], spec) if field else '') for literal, field, spec in parts)
@@ -1,58 +1,339 @@
+import hashlib
 import os
+import queue
+import random
+import threading
 import time
-import re
-import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
 from typing import Optional
-from pixivpy3 import AppPixivAPI
+from urllib.parse import urlsplit
+from rate_limiter import TokenBucket, TransferLimiter
+from download_ledger import DownloadLedger
+from api_cache import ApiCache
+from auth_manager import get_auth_manager, is_auth_error
+from cancel import CancelToken, DownloadCancelled
+from metrics import Metrics
+from filters import IllustFilter, RejectRateMonitor, TRANSIENT_REASONS
+from path_template import PathTemplate
+
+
+# 这些状态码表示触发了 Pixiv 的限流
+THROTTLE_STATUS = (403, 429)
+# 值得重试的 HTTP 状态码：限流和服务器临时错误
+RETRY_STATUS = THROTTLE_STATUS + (500, 502, 503, 504)
+# 单次重试等待的上限（秒），Retry-After 也不超过此值
+MAX_RETRY_DELAY = 120.0
+
+# App-API 每页返回的作品数，用于换算预取队列长度
+API_PAGE_SIZE = 30
+
+IMAGE_HEADERS = {
+    'Referer': 'https://www.pixiv.net/',
+    'User-Agent': 'Mozilla/5.0'
+}
+
+
+class IncompleteDownload(IOError):
+    """收到的数据比声明的长度短，可以续传或重试"""
+
+
+def parse_retry_after(value):
+    """解析 Retry-After 响应头（秒数或 HTTP 日期），无法解析时返回 None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    from datetime import datetime, timezone
+    from email.utils import parsedate_to_datetime
+
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_delay(attempt, base, retry_after=None):
+    """第 attempt 次（从 0 开始）重试前的等待秒数
+
+    服务器给出 Retry-After 时按其等待，否则为带完全随机抖动的指数退避，
+    避免多个下载线程在同一时刻一起重试。
+    """
+    if retry_after is not None:
+        return min(retry_after, MAX_RETRY_DELAY)
+    return random.uniform(0, min(MAX_RETRY_DELAY, base * 2 ** attempt))
+
+
+def _retry_info(error):
+    """返回 (是否可重试, Retry-After 秒数)"""
+    import requests
+
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        response = error.response
+        return response.status_code in RETRY_STATUS, parse_retry_after(response.headers.get('Retry-After'))
+    return isinstance(error, (requests.RequestException, IncompleteDownload)), None
+
+
+def connection_pool_size(download_workers, segment_threshold=0, segments=4):
+    """并发下载所需的连接池大小：分段下载时每个下载线程最多同时占用 segments 个连接"""
+    return max(10, max(1, int(download_workers)) * (max(1, int(segments)) if segment_threshold else 1))
+
+
+def create_session(pool_size, max_retries=3):
+    """创建图片下载用的 HTTP 会话；多账号同步时由各下载器共用"""
+    # requests 只在第一次下载图片时导入，不拖慢界面和命令行的启动
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+    # 这里只重试建立连接阶段的错误，HTTP 状态码和传输中断由 _fetch_page 按退避策略重试
+    retry = Retry(total=max_retries, connect=max_retries, read=0, status=0,
+                  backoff_factor=0.5, respect_retry_after_header=False,
+                  allowed_methods=frozenset(['GET', 'HEAD']))
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update(IMAGE_HEADERS)
+    return session
 
 
 class PixivDownloader:
     def __init__(self, refresh_token, download_path, min_bookmarks=0, min_likes=0, image_quality='original',
-                 recommended_limit=20, following_limit=20, delay=1.0, single_page_only=False, log_func=None):
-        self.api = AppPixivAPI()
+                 recommended_limit=20, following_limit=20, delay=1.0, single_page_only=False, download_workers=4,
+                 pool_size=None, max_retries=3, timeout=(10, 60), session=None, api_rate=None, cdn_rate=10.0,
+                 api_burst=3, engine='threaded', following_depth=5, following_fanout=4,
+                 incremental=True, cache_ttl=1800, cache_max_mb=64, metrics=None, metrics_file=None,
+                 include_tags=None, exclude_tags=None, illust_types=None, max_age_days=None, r18='include',
+                 max_pages=None, date_since=None, date_until=None, give_up_reject_rate=None, give_up_window=200,
+                 dedup=True, ugoira_format='webp', ugoira_workers=None, chunk_size=65536, segment_threshold=0,
+                 segments=4, prefetch_pages=2, cancel_token=None, retry_backoff=1.0, ledger=None,
+                 path_template='flat', bandwidth_limit=0, host_connections=0, transfer_limiter=None, log_func=None):
+        # 同一 refresh_token 的下载器和 Token 验证共用一个已登录的 API 客户端，access_token 缓存在磁盘上
+        self.auth = get_auth_manager(refresh_token)
         self.refresh_token = refresh_token
         self.download_path = Path(download_path)
         self.min_bookmarks = min_bookmarks
         self.min_likes = min_likes
+        # 额外的筛选条件，见 filters.IllustFilter
+        self.include_tags = include_tags
+        self.exclude_tags = exclude_tags
+        self.illust_types = illust_types
+        self.max_age_days = max_age_days
+        self.r18 = r18
+        self.max_pages = max_pages
+        self.date_since = date_since
+        self.date_until = date_until
+        # 最近 give_up_window 个作品中被筛掉的比例达到 give_up_reject_rate 时停止遍历
+        self.give_up_reject_rate = give_up_reject_rate
+        self.give_up_window = give_up_window
         self.image_quality = image_quality.lower()
         self.recommended_limit = recommended_limit
         self.following_limit = following_limit
+        # 每位关注画师最多遍历的作品数，以及同时获取作品列表的画师数
+        self.following_depth = max(1, int(following_depth))
+        self.following_fanout = max(1, int(following_fanout))
+        # 增量同步：每位画师只遍历到上次记录的水位线为止
+        self.incremental = incremental
         self.delay = delay
         self.single_page_only = single_page_only
+        # 内容去重：下载时计算 SHA-256，与已有文件内容相同的页改为硬链接
+        self.dedup = dedup
+        # ugoira 动图输出格式（webp/gif/apng），帧合成在独立的进程池中进行，不占用下载线程
+        self.ugoira_format = ugoira_format
+        self.ugoira_workers = ugoira_workers or max(1, (os.cpu_count() or 2) // 2)
+        # 文件相对下载目录的路径模板（预设名或自定义模板），见 path_template.PRESETS
+        self.path_template = PathTemplate(path_template)
+        self._made_dirs = set()
+        self._made_dirs_lock = threading.Lock()
+        self._assembler = None
+        self._assembling = set()
+        self._assembling_changed = threading.Condition()
+        self.download_workers = max(1, int(download_workers))
+        # 下载引擎: 'threaded' 线程池，'asyncio' 单线程事件循环（需要 aiohttp）
+        self.engine = engine
+        # 读取响应的缓冲区大小；不小于 segment_threshold 字节的图片拆成 segments 段并发下载，0 为关闭
+        self.chunk_size = max(4096, int(chunk_size))
+        self.segment_threshold = segment_threshold
+        self.segments = max(1, int(segments))
+        self.pool_size = pool_size or connection_pool_size(self.download_workers, segment_threshold, self.segments)
+        # 单页下载和 API 请求失败后的重试次数，以及指数退避的基准秒数
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.timeout = timeout
+        # 所有图片请求共用一个带连接池的会话，避免每张图都重新握手；外部传入的会话由调用方关闭
+        self._session = session
+        self._owns_session = session is None
+        # API 与图片 CDN 分开限速；未指定 api_rate 时沿用 delay 作为请求间隔
+        if api_rate is None:
+            api_rate = 1.0 / delay if delay > 0 else 0
+        self.api_limiter = TokenBucket(api_rate, burst=api_burst)
+        self.cdn_limiter = TokenBucket(cdn_rate, burst=self.download_workers)
+        # 图片下载的全局带宽上限（字节/秒）和每主机连接数上限，0 为不限；下载中可通过 transfer_limiter.set_limits() 调整。
+        # 传入外部 transfer_limiter 时（多账号、守护模式共用）忽略 bandwidth_limit 和 host_connections
+        self.transfer_limiter = transfer_limiter or TransferLimiter(bandwidth_limit, host_connections)
         self.log_func = log_func or print
+        # 元数据遍历最多领先下载方的页数，0 为不预取（在下载循环中同步翻页）
+        self.prefetch_pages = max(0, int(prefetch_pages))
+        # 取消后遍历、限速等待和下载数据块循环都会尽快停止，可由外部传入以便跨多次下载共用
+        self.cancel_token = cancel_token or CancelToken()
+        # 传入外部 metrics 时（如守护模式跨多次同步共用）由调用方负责关闭
+        self._owns_metrics = metrics is None
+        self.metrics = metrics or Metrics(jsonl_path=metrics_file)
+        self._metrics_start = None
         self.download_path.mkdir(parents=True, exist_ok=True)
-        self.downloaded_ids = set()
-        self._load_downloaded_ids()
+        # 下载记录和 API 缓存在第一次用到时才打开（旧版文本记录也在那时迁移），创建下载器不访问磁盘
+        self.cache_ttl = cache_ttl
+        self.cache_max_mb = cache_max_mb
+        # 传入的下载记录（如多账号同步共用的一份）由调用方关闭
+        self._ledger = ledger
+        self._owns_ledger = ledger is None
+        self._api_cache = None
+        self._open_lock = threading.Lock()
+        self._compile_filter()
+
+    @property
+    def api(self):
+        return self.auth.api
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._open_lock:
+                if self._session is None:
+                    self._session = create_session(self.pool_size, self.max_retries)
+        return self._session
+
+    @property
+    def ledger(self):
+        if self._ledger is None:
+            with self._open_lock:
+                if self._ledger is None:
+                    ledger = DownloadLedger(self.download_path / "downloads.db")
+                    self._migrate_text_ledger(ledger)
+                    self._ledger = ledger
+        return self._ledger
+
+    @property
+    def api_cache(self):
+        """API 响应缓存，cache_ttl 为 0 时为 None"""
+        if self._api_cache is None and self.cache_ttl:
+            with self._open_lock:
+                if self._api_cache is None:
+                    self._api_cache = ApiCache(self.download_path / "api_cache.db", ttl=self.cache_ttl,
+                                               max_bytes=self.cache_max_mb * 1024 * 1024)
+        return self._api_cache
+
+    def _compile_filter(self):
+        """根据当前设置编译筛选条件，每次开始下载时调用一次"""
+        self.filter = IllustFilter(min_bookmarks=self.min_bookmarks, min_likes=self.min_likes,
+                                   include_tags=self.include_tags, exclude_tags=self.exclude_tags,
+                                   types=self.illust_types, max_age_days=self.max_age_days, r18=self.r18,
+                                   max_pages=self.max_pages, since=self.date_since, until=self.date_until)
+        self.reject_monitor = RejectRateMonitor(self.give_up_reject_rate, self.give_up_window)
+        # 本次下载中被筛选条件永久排除的作品，以及已取到作品列表、等待推进水位线的画师
+        self._rejected_ids = set()
+        self._watermark_candidates = []
+
+    def close(self):
+        if self._assembler:
+            self._assembler.shutdown(wait=True)
+            self._assembler = None
+        if self._session and self._owns_session:
+            self._session.close()
+        if self._ledger and self._owns_ledger:
+            self._ledger.close()
+        if self._api_cache:
+            self._api_cache.close()
+        if self._owns_metrics:
+            self.metrics.close()
+
+    def stop(self):
+        """请求停止当前下载，可从任意线程调用"""
+        self.cancel_token.cancel()
 
     def log(self, msg):
         if self.log_func:
             self.log_func(msg)
 
-    def _load_downloaded_ids(self):
-        file = self.download_path / "downloaded_ids.txt"
-        if file.exists():
-            with open(file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    self.downloaded_ids.add(line.strip())
+    def _migrate_text_ledger(self, ledger):
+        migrated = ledger.migrate_text_ledger(self.download_path / "downloaded_ids.txt")
+        if migrated:
+            self.log(f"已将 {migrated} 条下载记录从 downloaded_ids.txt 迁移到 downloads.db")
+
+    def _api_call(self, method, *args, **kwargs):
+        """经过 API 缓存和限速器调用 pixivpy3，遇到限流响应时降速重试，网络错误按指数退避重试"""
+        cache_key = None
+        if self.api_cache:
+            # 推荐等接口的结果因账号而异，键中包含当前用户ID
+            cache_key = ApiCache.make_key(method, args, dict(kwargs, _account=self.api.user_id))
+            cached = self.api_cache.get(cache_key)
+            if cached is not None:
+                self.metrics.inc('api_cache_hit')
+                return cached
+            self.metrics.inc('api_cache_miss')
+        from pixivpy3 import PixivError
 
-    def _save_downloaded_id(self, illust_id):
-        file = self.download_path / "downloaded_ids.txt"
-        with open(file, 'a', encoding='utf-8') as f:
-            f.write(f"{illust_id}\n")
-        self.downloaded_ids.add(str(illust_id))
+        for attempt in range(self.max_retries + 1):
+            if not self.auth.valid:
+                # 长时间下载时 access_token 即将过期会在这里提前刷新
+                with self.metrics.stage('auth'):
+                    self.auth.ensure()
+            access_token = self.api.access_token
+            with self.metrics.stage('api_wait'):
+                self.api_limiter.acquire(cancel_token=self.cancel_token)
+            try:
+                with self.metrics.stage('api_page'):
+                    result = getattr(self.api, method)(*args, **kwargs)
+            except PixivError as e:
+                # pixivpy3 把连接错误和响应解析错误都包装成 PixivError
+                if attempt >= self.max_retries:
+                    raise
+                delay = retry_delay(attempt, self.retry_backoff)
+                self.metrics.inc('api_retries')
+                self.log(f"API请求出错，{delay:.1f} 秒后重试 ({attempt + 1}/{self.max_retries}): {e}")
+                self.cancel_token.sleep(delay)
+                continue
+            error = result.get('error') if isinstance(result, dict) else None
+            if is_auth_error(error) and attempt < self.max_retries:
+                self.log("登录凭据已失效，重新登录")
+                self.auth.invalidate(access_token)
+                continue
+            if not error or 'rate limit' not in str(error.get('message', '')).lower():
+                self.api_limiter.reward()
+                if cache_key and not error:
+                    self.api_cache.put(cache_key, result)
+                return result
+            self.api_limiter.penalize()
+            self.metrics.inc('api_throttled')
+            self.log(f"API请求被限流，降低请求速率至 {self.api_limiter.rate:.2f} 次/秒")
+            if attempt < self.max_retries:
+                self.cancel_token.sleep(retry_delay(attempt, self.retry_backoff))
+        raise Exception(f"{method} 多次被限流: {error}")
 
     def login(self):
+        """确保已登录；缓存的 access_token 未过期时不发起 OAuth 请求"""
         try:
-            self.api.auth(refresh_token=self.refresh_token)
-            self.log("登录成功！")
+            with self.metrics.stage('auth'):
+                refreshed = self.auth.ensure()
+            self.log("登录成功！" if refreshed else "登录成功（使用缓存的登录凭据）")
             return True
         except Exception as e:
             self.log(f"登录失败: {e}")
             return False
 
-    def _sanitize_filename(self, filename: str) -> str:
-        return re.sub(r'[<>:"/\\|?*]', '_', filename)
+    def _target_path(self, illust, page=0, multi_page=False, ext='jpg'):
+        """按路径模板得到文件的完整路径，并确保所在目录存在"""
+        filepath = self.download_path / self.path_template.render(illust, page, multi_page, ext)
+        parent = filepath.parent
+        if parent not in self._made_dirs:
+            parent.mkdir(parents=True, exist_ok=True)
+            with self._made_dirs_lock:
+                self._made_dirs.add(parent)
+        return filepath
 
     def _get_image_url(self, illust, page_index=0) -> Optional[str]:
         # 支持多页作品，page_index 默认0
@@ -79,138 +360,763 @@ class PixivDownloader:
             return illust['image_urls'].get('square_medium')
 
     def _should_download(self, illust):
-        if str(illust['id']) in self.downloaded_ids:
+        if illust['id'] in self.ledger:
+            self.metrics.inc('filter_rejected_downloaded')
             return False
-        if illust.get('total_bookmarks', 0) < self.min_bookmarks:
+        reason = self.filter.reject_reason(illust)
+        # 已下载的作品不计入被拒比例，只统计不满足筛选条件的作品
+        self.reject_monitor.record(reason is not None)
+        if reason:
+            self.metrics.inc(f'filter_rejected_{reason}')
+            if reason not in TRANSIENT_REASONS:
+                self._rejected_ids.add(illust['id'])
             return False
-        if illust.get('total_view', 0) < self.min_likes:
+        self.metrics.inc('filter_accepted')
+        return True
+
+    def _should_give_up(self):
+        if not self.reject_monitor.should_give_up():
+            return False
+        self.log(f"最近 {self.give_up_window} 个作品中有 {self.reject_monitor.reject_rate:.0%} 不满足筛选条件，停止遍历")
+        return True
+
+    def _fetch_page(self, url, filepath, dedup=True):
+        """下载单页，遇到限流、服务器临时错误或传输中断时按指数退避重试
+
+        每次重试都从 .part 文件续传，已收到的数据不会重新下载。
+        dedup=False 时不计算内容哈希（如动图帧 ZIP 这样的中间文件），不参与去重。
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._download_page(url, filepath, dedup)
+            except Exception as e:
+                retryable, retry_after = _retry_info(e)
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                delay = retry_delay(attempt, self.retry_backoff, retry_after)
+                self.metrics.inc('page_retries')
+                self.log(f"下载出错，{delay:.1f} 秒后重试 ({attempt + 1}/{self.max_retries}) {filepath.name}: {e}")
+                self.cancel_token.sleep(delay)
+
+    def _download_page(self, url, filepath, dedup=True):
+        """占用一个该主机的连接名额下载单页，返回文件字节数"""
+        host = urlsplit(url).hostname
+        with self.metrics.stage('host_wait'):
+            self.transfer_limiter.connections.acquire(host, self.cancel_token)
+        try:
+            return self._transfer_page(url, filepath, dedup)
+        finally:
+            self.transfer_limiter.connections.release(host)
+
+    def _throttle(self, nbytes):
+        """计入收到的字节并按全局带宽上限等待，返回等待的秒数"""
+        return self.transfer_limiter.throttle(nbytes, self.cancel_token)
+
+    def _observe_transfer(self, elapsed, write_time, throttle_time):
+        self.metrics.observe('transfer', elapsed - write_time - throttle_time)
+        self.metrics.observe('disk_write', write_time)
+        if throttle_time:
+            self.metrics.observe('bandwidth_wait', throttle_time)
+
+    def _transfer_page(self, url, filepath, dedup=True):
+        """下载单页到 .part 临时文件，完成后原子重命名，返回文件字节数
+
+        临时文件已存在时用 Range 请求续传，服务器不支持续传时从头下载。
+        """
+        part = filepath.with_name(filepath.name + '.part')
+        offset = part.stat().st_size if part.exists() else 0
+        while True:
+            headers = {'Range': f'bytes={offset}-'} if offset else None
+            with self.metrics.stage('cdn_wait'):
+                self.cdn_limiter.acquire(cancel_token=self.cancel_token)
+            # stream=True 时 get() 在收到响应头后返回，这段耗时包含建立连接和首字节
+            with self.metrics.stage('request'):
+                response = self.session.get(url, stream=True, timeout=self.timeout, headers=headers)
+            with response:
+                if response.status_code in THROTTLE_STATUS:
+                    self.metrics.inc('cdn_throttled')
+                    self.cdn_limiter.penalize()
+                else:
+                    self.cdn_limiter.reward()
+                # 临时文件比服务器上的文件还大，丢弃后重新下载
+                if offset and response.status_code == 416:
+                    offset = 0
+                    continue
+                response.raise_for_status()
+                if offset and response.status_code != 206:
+                    offset = 0
+                length = response.headers.get('Content-Length')
+                expected = offset + int(length) if length is not None else None
+                total = response.headers.get('Content-Range', '').rpartition('/')[2]
+                if offset and total.isdigit():
+                    expected = int(total)
+                if not offset and self._segmentable(response.status_code, response.headers, expected):
+                    return self._download_segmented(url, response, expected, filepath, dedup)
+                hasher = self._content_hasher(part, offset) if dedup else None
+                write_time = throttle_time = 0.0
+                transfer_start = time.perf_counter()
+                with open(part, 'ab' if offset else 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        # 取消时 .part 文件保留，下次运行时续传
+                        self.cancel_token.check()
+                        write_start = time.perf_counter()
+                        f.write(chunk)
+                        if hasher:
+                            hasher.update(chunk)
+                        write_time += time.perf_counter() - write_start
+                        throttle_time += self._throttle(len(chunk))
+                self._observe_transfer(time.perf_counter() - transfer_start, write_time, throttle_time)
+            break
+
+        size = part.stat().st_size
+        if expected is not None and size != expected:
+            # 比预期大的临时文件无法续传，删除后下次从头下载
+            if size > expected:
+                part.unlink()
+            raise IncompleteDownload(f"文件不完整: {size}/{expected} 字节")
+        self._commit_page(part, filepath, size, hasher)
+        self.metrics.inc('pages_downloaded')
+        self.metrics.inc('bytes_downloaded', size)
+        return size
+
+    def _segmentable(self, status, headers, length):
+        """完整响应（非续传）的大文件且服务器支持 Range 时改为分段下载"""
+        return (bool(self.segment_threshold) and self.segments > 1 and status == 200 and length is not None
+                and length >= self.segment_threshold and headers.get('Accept-Ranges', '').lower() == 'bytes')
+
+    def _segment_bounds(self, total):
+        """把 [0, total) 平均拆成 segments 段，返回 [(起始, 结束), ...]（结束位置不含）"""
+        step = -(-total // self.segments)
+        return [(start, min(start + step, total)) for start in range(0, total, step)]
+
+    def _download_segmented(self, url, response, total, filepath, dedup=True):
+        """分段并发下载大文件，返回文件字节数
+
+        已收到的完整响应继续读取第一段，其余各段用 Range 请求并发获取，
+        各自以独立文件句柄定位写入预先分配好大小的 .seg 临时文件。
+        分段文件有空洞，不参与 .part 续传，中断后从头下载。
+        每主机连接数已满时，取不到名额的分段在第一段完成后用当前连接依次下载，不会互相等待。
+        """
+        seg = filepath.with_name(filepath.name + '.seg')
+        bounds = self._segment_bounds(total)
+        with open(seg, 'wb') as f:
+            f.truncate(total)
+        connections = self.transfer_limiter.connections
+        host = urlsplit(url).hostname
+        transfer_start = time.perf_counter()
+        try:
+            parallel, deferred = [], []
+            for bound in bounds[1:]:
+                (parallel if connections.try_acquire(host) else deferred).append(bound)
+            with ThreadPoolExecutor(max_workers=max(1, len(parallel)), thread_name_prefix='pixiv-segment') as pool:
+                futures = [pool.submit(self._fetch_segment_released, host, url, seg, start, end)
+                           for start, end in parallel]
+                self._write_segment(response.iter_content(chunk_size=self.chunk_size), seg, *bounds[0])
+                response.close()
+                for start, end in deferred:
+                    self._fetch_segment(url, seg, start, end)
+                for future in futures:
+                    future.result()
+        except BaseException:
+            seg.unlink(missing_ok=True)
+            raise
+        self.metrics.observe('transfer', time.perf_counter() - transfer_start)
+
+        size = seg.stat().st_size
+        if size != total:
+            seg.unlink()
+            raise IncompleteDownload(f"文件不完整: {size}/{total} 字节")
+        # 分段写入无法边写边计算哈希，开启去重时在完成后读一遍
+        self._commit_page(seg, filepath, size, self._content_hasher(seg, size) if dedup else None)
+        self.metrics.inc('pages_segmented')
+        self.metrics.inc('pages_downloaded')
+        self.metrics.inc('bytes_downloaded', size)
+        return size
+
+    def _fetch_segment_released(self, host, url, seg, start, end):
+        """下载已取得连接名额的分段，完成后归还名额"""
+        try:
+            self._fetch_segment(url, seg, start, end)
+        finally:
+            self.transfer_limiter.connections.release(host)
+
+    def _fetch_segment(self, url, seg, start, end):
+        with self.metrics.stage('cdn_wait'):
+            self.cdn_limiter.acquire(cancel_token=self.cancel_token)
+        with self.metrics.stage('request'):
+            response = self.session.get(url, stream=True, timeout=self.timeout,
+                                        headers={'Range': f'bytes={start}-{end - 1}'})
+        with response:
+            if response.status_code in THROTTLE_STATUS:
+                self.metrics.inc('cdn_throttled')
+                self.cdn_limiter.penalize()
+            else:
+                self.cdn_limiter.reward()
+            response.raise_for_status()
+            if response.status_code != 206:
+                raise IOError(f"服务器未按范围返回分段: HTTP {response.status_code}")
+            self._write_segment(response.iter_content(chunk_size=self.chunk_size), seg, start, end)
+
+    def _write_segment(self, chunks, seg, start, end):
+        """把数据块写入 seg 文件的 [start, end) 区间，超出部分丢弃，数据不足时报错"""
+        remaining = end - start
+        with open(seg, 'r+b') as f:
+            f.seek(start)
+            for chunk in chunks:
+                self.cancel_token.check()
+                f.write(chunk[:remaining])
+                self._throttle(min(len(chunk), remaining))
+                remaining -= min(len(chunk), remaining)
+                if not remaining:
+                    return
+        raise IncompleteDownload(f"分段 {start}-{end - 1} 不完整，缺少 {remaining} 字节")
+
+    def _content_hasher(self, part, offset):
+        """开启去重时返回边写边更新的哈希对象；续传时先读入已下载的部分"""
+        if not self.dedup:
+            return None
+        hasher = hashlib.sha256()
+        if offset:
+            with open(part, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    hasher.update(block)
+        return hasher
+
+    def _commit_page(self, part, filepath, size, hasher=None):
+        """把下载完成的临时文件放到最终位置
+
+        开启去重时按内容哈希查找已有文件，找到则把 filepath 硬链接到该文件并删除临时文件，
+        相同的图片（重复上传、转载、不同作品中的同一页）在磁盘上只保存一份。
+        """
+        if hasher is None:
+            os.replace(part, filepath)
+            return
+        digest = hasher.hexdigest()
+        for existing, existing_size in self.ledger.find_by_hash(digest):
+            existing = Path(existing)
+            if existing != filepath and existing_size == size and self._link_duplicate(existing, size, part, filepath):
+                break
+        else:
+            os.replace(part, filepath)
+        self.ledger.record_hash(filepath, digest, size)
+
+    def _link_duplicate(self, existing, size, part, filepath):
+        try:
+            if existing.stat().st_size != size:
+                return False
+            link = filepath.with_name(filepath.name + '.link')
+            if link.exists():
+                link.unlink()
+            os.link(existing, link)
+            os.replace(link, filepath)
+        except OSError:
+            # 原文件已被删除，或文件系统不支持硬链接（如 FAT32、跨分区）时照常保存
             return False
+        part.unlink()
+        self.metrics.inc('pages_deduplicated')
+        self.metrics.inc('bytes_deduplicated', size)
+        self.log(f"内容与 {existing.name} 相同，已创建硬链接: {filepath.name}")
         return True
 
+    def _page_targets(self, illust):
+        """返回作品需要下载的 (页码, URL, 文件路径) 列表"""
+        illust_id = illust['id']
+        multi_page = len(illust.get('meta_pages', [])) > 1
+
+        # 判断是否多页作品
+        pages = illust.get('meta_pages', [])
+        if not pages:
+            pages = [{}]  # 单页作品用空 dict 模拟
+
+        # 如果设置了只下载单页且是多页作品，则只下载第一页
+        if self.single_page_only and len(pages) > 1:
+            pages = pages[:1]  # 只保留第一页
+            self.log(f"多页作品 {illust_id} 仅下载第一页")
+
+        targets = []
+        for i, _ in enumerate(pages):
+            url = self._get_image_url(illust, page_index=i)
+            if not url:
+                self.log(f"未找到图片URL: {illust_id} 页码: {i}")
+                continue
+
+            ext = url.split('.')[-1].split('?')[0].lower()
+            if ext not in ['jpg', 'jpeg', 'png', 'gif']:
+                ext = 'jpg'
+
+            targets.append((i, url, self._target_path(illust, i, multi_page, ext)))
+        return targets
+
+    def _finished_page_size(self, illust_id, page, filepath):
+        """上次已完整下载的页返回其字节数，否则返回 None"""
+        done = self.ledger.get_page(illust_id, page)
+        if done and filepath.exists() and filepath.stat().st_size == done[1]:
+            return done[1]
+        return None
+
+    def _record_illust(self, illust, page_count, total_bytes):
+        self.metrics.inc('illusts_downloaded')
+        with self.metrics.stage('ledger_commit'):
+            self.ledger.record(illust['id'], user_id=illust['user'].get('id'), user_name=illust['user']['name'],
+                               title=illust['title'], pages=page_count, quality=self.image_quality,
+                               size=total_bytes)
+            self.ledger.clear_failure(illust['id'])
+
+    def _claim(self, illust):
+        """在下载记录中登记作品；共用下载记录的其他下载器已下载或正在下载时跳过"""
+        if self.ledger.claim(illust['id']):
+            return True
+        self.metrics.inc('illusts_claimed_elsewhere')
+        return False
+
+    def _record_failure(self, illust, error):
+        """重试耗尽的作品写入失败队列，之后可通过 download_failed() 重新下载"""
+        self.metrics.inc('illusts_failed')
+        self.log(f"✗ 下载失败 {illust['id']}: {error}")
+        self.ledger.record_failure(illust, str(error))
+
     def download_illust(self, illust):
+        if not self._claim(illust):
+            return False
         try:
+            if illust.get('type') == 'ugoira':
+                return self._download_ugoira(illust)
             illust_id = illust['id']
-            user_name = illust['user']['name']
-            title = illust['title']
-
-            # 判断是否多页作品
-            pages = illust.get('meta_pages', [])
-            if not pages:
-                pages = [{}]  # 单页作品用空 dict 模拟
-
-            # 如果设置了只下载单页且是多页作品，则只下载第一页
-            if self.single_page_only and len(pages) > 1:
-                pages = pages[:1]  # 只保留第一页
-                self.log(f"多页作品 {illust_id} 仅下载第一页")
-
-            for i, _ in enumerate(pages):
-                url = self._get_image_url(illust, page_index=i)
-                if not url:
-                    self.log(f"未找到图片URL: {illust_id} 页码: {i}")
+            targets = self._page_targets(illust)
+            total_bytes = 0
+            for i, url, filepath in targets:
+                # 上次已完整下载的页直接跳过
+                done = self._finished_page_size(illust_id, i, filepath)
+                if done is not None:
+                    total_bytes += done
                     continue
 
-                ext = url.split('.')[-1].split('?')[0].lower()
-                if ext not in ['jpg', 'jpeg', 'png', 'gif']:
-                    ext = 'jpg'
+                size = self._fetch_page(url, filepath)
+                self.ledger.record_page(illust_id, i, filepath, size)
+                total_bytes += size
+                self.log(f"✓ 下载完成: {filepath.name}")
 
-                if len(illust.get('meta_pages', [])) > 1:
-                    filename = f"{user_name}_{title}_{illust_id}_p{i}.{ext}"
-                else:
-                    filename = f"{user_name}_{title}_{illust_id}.{ext}"
+            self._record_illust(illust, len(targets), total_bytes)
+            return True
+        except DownloadCancelled:
+            # 已完成的页已记录，未完成的页保留 .part 文件，下次运行时续传
+            self.metrics.inc('illusts_cancelled')
+            self.ledger.release(illust['id'])
+            return False
+        except Exception as e:
+            self._record_failure(illust, e)
+            return False
 
-                filename = self._sanitize_filename(filename)
-                filepath = self.download_path / filename
+    def _download_ugoira(self, illust):
+        """下载 ugoira 的帧 ZIP 并提交到进程池合成动图，不等待合成完成
 
-                headers = {
-                    'Referer': 'https://www.pixiv.net/',
-                    'User-Agent': 'Mozilla/5.0'
-                }
+        合成成功后才写入下载记录并删除 ZIP；合成前退出的作品下次运行时重新下载。
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        from ugoira import FORMATS, assemble
 
-                # 下载图片
-                response = requests.get(url, headers=headers, stream=True)
-                response.raise_for_status()
-                with open(filepath, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        f.write(chunk)
+        illust_id = illust['id']
+        filepath = self._target_path(illust, ext=FORMATS[self.ugoira_format][1])
+        done = self._finished_page_size(illust_id, 0, filepath)
+        if done is not None:
+            self._record_illust(illust, 1, done)
+            return True
 
-                self.log(f"✓ 下载完成: {filename}")
-                time.sleep(self.delay)
+        result = self._api_call('ugoira_metadata', illust_id)
+        metadata = result.get('ugoira_metadata')
+        if not metadata:
+            raise Exception(f"获取动图信息失败: {result.get('error')}")
+        zip_url = metadata['zip_urls']['medium']
+        if self.image_quality == 'original':
+            # 元数据只给出 600x600 的 ZIP，原尺寸帧在同目录下
+            zip_url = zip_url.replace('600x600', '1920x1080')
+        zip_path = filepath.with_suffix('.zip')
+        # ZIP 合成后即删除，只对合成出的动图计算哈希去重
+        self._fetch_page(zip_url, zip_path, dedup=False)
 
-            self._save_downloaded_id(illust_id)
-            return True
+        with self._open_lock:
+            if self._assembler is None:
+                self._assembler = ProcessPoolExecutor(max_workers=self.ugoira_workers)
+        # 合成到 .part 临时文件，完成后与下载的图片一样按内容去重并放到最终位置
+        part = filepath.with_name(filepath.name + '.part')
+        future = self._assembler.submit(assemble, str(zip_path), list(metadata['frames']), str(part),
+                                        self.ugoira_format)
+        with self._assembling_changed:
+            self._assembling.add(future)
+        future.add_done_callback(lambda f: self._ugoira_assembled(f, illust, zip_path, part, filepath))
+        self.log(f"↻ 动图帧已下载，正在合成: {filepath.name}")
+        return True
+
+    def _ugoira_assembled(self, future, illust, zip_path, part, filepath):
+        try:
+            if future.cancelled():
+                self.log(f"动图合成已取消，下次运行时重新下载: {filepath.name}")
+                self.ledger.release(illust['id'])
+                return
+            size, seconds = future.result()
+            self.metrics.observe('ugoira_encode', seconds)
+            self._commit_page(part, filepath, size, self._content_hasher(part, size))
+            self.ledger.record_page(illust['id'], 0, filepath, size)
+            self._record_illust(illust, 1, size)
+            zip_path.unlink(missing_ok=True)
+            self.log(f"✓ 动图合成完成: {filepath.name}")
         except Exception as e:
-            self.log(f"✗ 下载失败 {illust['id']}: {e}")
+            self._record_failure(illust, f"动图合成失败: {e}")
+        finally:
+            with self._assembling_changed:
+                self._assembling.discard(future)
+                self._assembling_changed.notify_all()
+
+    def _wait_assembly(self):
+        """等待进程池中的动图合成全部完成，并提交它们的下载记录"""
+        with self._assembling_changed:
+            if not self._assembling:
+                return
+            if self.cancel_token.cancelled:
+                # 尚未开始的合成直接取消，正在合成的等待其完成
+                for future in list(self._assembling):
+                    future.cancel()
+            self.log(f"等待 {len(self._assembling)} 个动图合成完成...")
+            self._assembling_changed.wait_for(lambda: not self._assembling)
+        with self.metrics.stage('ledger_commit'):
+            self.ledger.flush()
+
+    def _iter_recommended(self):
+        """逐页遍历推荐作品"""
+        offset = 0
+        while True:
+            result = self._api_call('illust_recommended', content_type=self.filter.api_type() or 'illust',
+                                    offset=offset)
+            illusts = result.get('illusts', [])
+            if not illusts:
+                return
+            yield from illusts
+            offset += len(illusts)
+
+    def _iter_pages(self, method, *args, **kwargs):
+        """按 next_url 翻页，逐页返回 API 结果"""
+        result = self._api_call(method, *args, **kwargs)
+        while True:
+            yield result
+            next_qs = self.api.parse_qs(result.get('next_url'))
+            if not next_qs:
+                return
+            result = self._api_call(method, **next_qs)
+
+    def _iter_following_users(self):
+        for result in self._iter_pages('user_following', self.api.user_id):
+            for user in result.get('user_previews', []):
+                yield user['user']['id']
+
+    def _fetch_user_illusts(self, user_id, finished=None):
+        """翻页获取画师最新的 following_depth 个作品，增量同步时遇到水位线即停止翻页，返回 (作品列表, 是否完整)
+
+        已取到 following_limit 个待下载的作品，或 finished 被设置（下载方已不再取用）时不再请求后面的页；
+        这样得到的列表缺少更早的作品，不能据此推进水位线。
+        """
+        watermark = None
+        if self.incremental:
+            watermark = self.ledger.get_watermark(self.api.user_id, user_id, self.filter.fingerprint)
+        illusts = []
+        wanted = 0
+        for result in self._iter_pages('user_illusts', user_id, type=self.filter.api_type()):
+            for illust in result.get('illusts', []):
+                if watermark and illust['id'] <= watermark[0]:
+                    return illusts, True
+                # 作品按时间倒序排列，早于日期窗口之后的都不需要
+                if self.filter.older_than_window(illust):
+                    return illusts, True
+                illusts.append(illust)
+                if len(illusts) >= self.following_depth:
+                    return illusts, True
+                if illust['id'] not in self.ledger and self.filter.reject_reason(illust) is None:
+                    wanted += 1
+            stopped = finished is not None and finished.is_set()
+            if result.get('next_url') and (wanted >= self.following_limit or stopped):
+                return illusts, False
+        return illusts, True
+
+    def _take_user_illusts(self, user_id, future):
+        try:
+            illusts, complete = future.result()
+        except DownloadCancelled:
+            return
+        except Exception as e:
+            self.log(f"获取用户{user_id}作品失败: {e}")
+            return
+        if self.incremental and illusts and complete:
+            self._watermark_candidates.append((user_id, illusts))
+        yield from illusts
+
+    def _settled(self, illust_id):
+        """作品已下载、已进入失败队列或被当前筛选条件排除，在筛选条件不变时下次同步不需要再检查"""
+        return illust_id in self.ledger or self.ledger.has_failure(illust_id) or illust_id in self._rejected_ids
+
+    def _advance_watermarks(self):
+        """下载结束后推进画师水位线
+
+        水位线按当前账号记录，只推进到这样的最新作品：它和本次取到的所有更早作品都已处理完毕。
+        因数量上限、取消而未处理的作品，以及因收藏数等会变化的条件被拒的作品，下次同步时会重新检查。
+        水位线与筛选条件的摘要一起保存，放宽标签、类型、日期等条件后会重新检查被这些条件排除的作品。
+        """
+        candidates, self._watermark_candidates = self._watermark_candidates, []
+        for user_id, illusts in candidates:
+            newest = None
+            for illust in sorted(illusts, key=lambda illust: illust['id']):
+                if not self._settled(illust['id']):
+                    break
+                newest = illust
+            if newest:
+                self.ledger.set_watermark(self.api.user_id, user_id, newest['id'], newest.get('create_date'),
+                                          self.filter.fingerprint)
+
+    def _iter_following(self, finished=None):
+        """遍历所有关注画师的最新作品
+
+        关注列表按 next_url 翻页；各画师的作品列表由 following_fanout 个线程并发获取，
+        最多提前获取 following_fanout 位画师，结果按关注列表顺序返回。
+        finished 为下载方结束时设置的事件，设置后获取中的画师在当前页之后停止翻页。
+        """
+        pool = ThreadPoolExecutor(max_workers=self.following_fanout, thread_name_prefix='pixiv-walker')
+        window = deque()
+        try:
+            for user_id in self._iter_following_users():
+                window.append((user_id, pool.submit(self._fetch_user_illusts, user_id, finished)))
+                if len(window) >= self.following_fanout:
+                    yield from self._take_user_illusts(*window.popleft())
+            while window:
+                yield from self._take_user_illusts(*window.popleft())
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _prefetch(self, illusts, finished=None):
+        """在后台线程中运行元数据遍历器，通过有界队列把作品交给下载方
+
+        遍历器最多领先 prefetch_pages 页，队列满时阻塞，内存占用与下载数量上限无关。
+        下载方不再取用（生成器被关闭）或取消时设置 finished，两边都会在约 0.1 秒内退出。
+        """
+        finished = finished or threading.Event()
+        if not self.prefetch_pages:
+            try:
+                for item in illusts:
+                    if self.cancel_token.cancelled:
+                        return
+                    yield item
+            finally:
+                finished.set()
+                if hasattr(illusts, 'close'):
+                    illusts.close()
+            return
+
+        items = queue.Queue(maxsize=self.prefetch_pages * API_PAGE_SIZE)
+
+        def put(kind, item=None):
+            while not finished.is_set() and not self.cancel_token.cancelled:
+                try:
+                    items.put((kind, item), timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
             return False
 
+        def produce():
+            try:
+                for item in illusts:
+                    if not put('illust', item):
+                        return
+                put('end')
+            except Exception as e:
+                put('error', e)
+            finally:
+                # 遍历器必须在运行它的线程中关闭，使其 finally（如画师线程池）得以执行
+                if hasattr(illusts, 'close'):
+                    illusts.close()
+
+        producer = threading.Thread(target=produce, name='pixiv-prefetch', daemon=True)
+        producer.start()
+        try:
+            while not self.cancel_token.cancelled:
+                try:
+                    kind, item = items.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if kind == 'end':
+                    return
+                if kind == 'error':
+                    raise item
+                yield item
+        finally:
+            finished.set()
+            producer.join()
+
+    def _collect_finished(self, done, count, limit, progress_callback):
+        for future in done:
+            if future.result() and count < limit:
+                count += 1
+                if progress_callback:
+                    progress_callback(count, limit)
+        return count
+
+    def _download_pool(self, illusts, limit, progress_callback=None, finished=None):
+        """由元数据遍历器喂给下载线程池，返回成功下载的作品数
+
+        进度回调只在当前线程（遍历线程）中调用，回调抛出的异常（如用户中断）会直接向上传播。
+        下载结束时设置 finished，遍历器可据此停止提前获取。
+        """
+        illusts = self._prefetch(illusts, finished)
+        if self.engine == 'asyncio':
+            from async_engine import AsyncDownloadEngine
+            try:
+                return AsyncDownloadEngine(self).run(illusts, limit, progress_callback)
+            finally:
+                illusts.close()
+                self._wait_assembly()
+
+        count = 0
+        pending = set()
+        submitted = set()
+        pool = ThreadPoolExecutor(max_workers=self.download_workers, thread_name_prefix='pixiv-download')
+        try:
+            for illust in illusts:
+                # 线程池已满，或在途任务全部成功即可达到上限时，先等待任务完成
+                while (pending and (len(pending) >= self.download_workers or count + len(pending) >= limit)
+                       and not self.cancel_token.cancelled):
+                    done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                    count = self._collect_finished(done, count, limit, progress_callback)
+                if count >= limit or self.cancel_token.cancelled:
+                    break
+                if illust['id'] in submitted or not self._should_download(illust):
+                    if self._should_give_up():
+                        break
+                    continue
+                submitted.add(illust['id'])
+                pending.add(pool.submit(self.download_illust, illust))
+            while pending and count < limit and not self.cancel_token.cancelled:
+                done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                count = self._collect_finished(done, count, limit, progress_callback)
+        finally:
+            illusts.close()
+            for future in pending:
+                future.cancel()
+            pool.shutdown(wait=True)
+            with self.metrics.stage('ledger_commit'):
+                self.ledger.flush()
+            self._wait_assembly()
+        return count
+
     def download_recommended(self, progress_callback=None):
+        self._start_metrics()
         if not self.login():
             return 0
+        self._compile_filter()
 
-        self.log(f"开始下载推荐作品 (数量: {self.recommended_limit})")
-        offset = 0
+        self.log(f"开始下载推荐作品 (数量: {self.recommended_limit}, 并发: {self.download_workers}, 引擎: {self.engine})")
         count = 0
         try:
-            while count < self.recommended_limit:
-                result = self.api.illust_recommended(offset=offset)
-                illusts = result.get('illusts', [])
-                if not illusts:
-                    break
-                for illust in illusts:
-                    if count >= self.recommended_limit:
-                        break
-                    if self._should_download(illust):
-                        if self.download_illust(illust):
-                            count += 1
-                            if progress_callback:
-                                progress_callback(count, self.recommended_limit)
-                    time.sleep(self.delay)
-                offset += len(illusts)
+            count = self._download_pool(self._iter_recommended(), self.recommended_limit, progress_callback)
+        except DownloadCancelled:
+            pass
         except Exception as e:
             self.log(f"获取推荐作品失败: {e}")
 
+        if self.cancel_token.cancelled:
+            self.log("下载已停止，未完成的图片保留为 .part 文件，下次运行时续传")
         self.log(f"推荐作品下载完成: {count}/{self.recommended_limit}")
+        if self.api_cache:
+            self.log(self.api_cache.stats_text())
+        self._log_failures()
+        self._log_metrics()
         return count
 
     def download_following(self, progress_callback=None):
+        self._start_metrics()
         if not self.login():
             return 0
+        self._compile_filter()
 
-        self.log(f"开始下载关注画师作品 (数量: {self.following_limit})")
+        self.log(f"开始下载关注画师作品 (数量: {self.following_limit}, 并发: {self.download_workers}, 引擎: {self.engine})")
         count = 0
         try:
-            following = self.api.user_following(self.api.user_id)
-            users = following.get('user_previews', [])
-            for user in users:
-                if count >= self.following_limit:
-                    break
-                user_id = user['user']['id']
-                try:
-                    illusts = self.api.user_illusts(user_id).get('illusts', [])[:5]
-                    for illust in illusts:
-                        if count >= self.following_limit:
-                            break
-                        if self._should_download(illust):
-                            if self.download_illust(illust):
-                                count += 1
-                                if progress_callback:
-                                    progress_callback(count, self.following_limit)
-                        time.sleep(self.delay)
-                except Exception as e:
-                    self.log(f"获取用户{user_id}作品失败: {e}")
+            finished = threading.Event()
+            count = self._download_pool(self._iter_following(finished), self.following_limit, progress_callback,
+                                        finished)
+        except DownloadCancelled:
+            pass
         except Exception as e:
             self.log(f"获取关注画师作品失败: {e}")
+        finally:
+            self._advance_watermarks()
 
+        if self.cancel_token.cancelled:
+            self.log("下载已停止，未完成的图片保留为 .part 文件，下次运行时续传")
         self.log(f"关注画师作品下载完成: {count}/{self.following_limit}")
+        if self.api_cache:
+            self.log(self.api_cache.stats_text())
+        self._log_failures()
+        self._log_metrics()
+        return count
+
+    def download_failed(self, progress_callback=None):
+        """重新下载失败队列中的作品
+
+        队列保存了作品的完整信息，不需要重新请求 API；失败时的筛选条件已经检查过，这里不再筛选。
+        成功的作品从队列中移除，再次失败的作品累加失败次数后留在队列中。
+        """
+        self._start_metrics()
+        if not self.login():
+            return 0
+        self.filter = IllustFilter()
+        self.reject_monitor = RejectRateMonitor(self.give_up_reject_rate, self.give_up_window)
+
+        illusts = []
+        for illust in self.ledger.failures():
+            if illust['id'] in self.ledger:
+                # 其他途径已下载完成的作品直接移出队列
+                self.ledger.clear_failure(illust['id'])
+            else:
+                illusts.append(illust)
+        if not illusts:
+            self.log("失败队列为空，没有需要重试的作品")
+            return 0
+
+        self.log(f"开始重试失败作品 (数量: {len(illusts)}, 并发: {self.download_workers}, 引擎: {self.engine})")
+        count = 0
+        try:
+            count = self._download_pool(iter(illusts), len(illusts), progress_callback)
+        except DownloadCancelled:
+            pass
+
+        if self.cancel_token.cancelled:
+            self.log("下载已停止，未完成的图片保留为 .part 文件，下次运行时续传")
+        self.log(f"失败作品重试完成: {count}/{len(illusts)}")
+        self._log_failures()
+        self._log_metrics()
         return count
 
+    def _log_failures(self):
+        failed = self.ledger.failure_count()
+        if failed:
+            self.log(f"失败队列中有 {failed} 个作品，可点击「重试失败作品」或使用 --mode failed 重新下载")
+
+    def _start_metrics(self):
+        # 统计可能由多次同步或多个账号共用，汇总只输出本次下载新增的部分
+        self._metrics_start = self.metrics.snapshot()
+
+    def _log_metrics(self):
+        for line in self.metrics.summary_lines(self._metrics_start):
+            self.log(line)
+
     def run(self):
         self.log("Pixiv自动下载器启动...")
         if not self.login():
             return
 
         total_downloaded = 0
-        total_downloaded += self.download_recommended()
-        total_downloaded += self.download_following()
+        try:
+            total_downloaded += self.download_recommended()
+            total_downloaded += self.download_following()
+        finally:
+            self.close()
 
         self.log(f"\n下载完成！总共下载了 {total_downloaded} 个作品")
         self.log(f"文件保存在: {self.download_path}")
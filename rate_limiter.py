@@ -0,0 +1,253 @@
+import threading
+import time
+from collections import deque
+
+
+class TokenBucket:
+    """线程安全的令牌桶限速器
+
+    rate 为每秒补充的令牌数（None 或 0 表示不限速），burst 为桶容量，允许短时间突发。
+    遇到 429/403 时调用 penalize() 降速，之后每次成功调用 reward() 逐步恢复到初始速率。
+    """
+
+    def __init__(self, rate, burst=1, min_rate=0.1, recover_after=10.0):
+        self.base_rate = rate or 0
+        self.rate = self.base_rate
+        self.burst = max(1, burst)
+        self.min_rate = min_rate
+        self.recover_after = recover_after
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._last_penalty = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def unlimited(self):
+        return self.rate <= 0
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, tokens=1):
+        """预占令牌，返回调用方需要等待的秒数"""
+        with self._lock:
+            if self.unlimited:
+                return 0.0
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self, tokens=1, cancel_token=None):
+        """等待直到取得令牌；传入 cancel_token 时等待可被取消"""
+        wait = self.reserve(tokens)
+        if cancel_token:
+            cancel_token.sleep(wait)
+        elif wait > 0:
+            time.sleep(wait)
+
+    def penalize(self):
+        """收到限流响应，速率减半并清空桶"""
+        with self._lock:
+            now = time.monotonic()
+            if self.unlimited:
+                return
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, 0.0)
+            self._last_penalty = now
+
+    def reward(self):
+        """请求成功，距上次降速足够久后按 10% 步长恢复速率"""
+        with self._lock:
+            if self.rate >= self.base_rate or self.unlimited:
+                return
+            now = time.monotonic()
+            if now - self._last_penalty < self.recover_after:
+                return
+            self._refill(now)
+            self.rate = min(self.base_rate, self.rate + self.base_rate * 0.1)
+            self._last_penalty = now
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.base_rate = rate or 0
+            self.rate = self.base_rate
+
+
+class BandwidthLimiter:
+    """按字节计的全局带宽上限，rate 为字节/秒，0 表示不限
+
+    每次收到数据先 reserve() 取得排队号（累计请求的字节数），累计放行的字节数按 rate 增长到排队号时才能继续，
+    空闲时最多积累 1 秒的额度。等待时间每次都按当前速率重新计算，运行中调高或取消上限会让正在等待的下载立即加速。
+    """
+
+    def __init__(self, rate=0):
+        self.rate = max(0, rate or 0)
+        self._reserved = 0
+        self._allowance = float(self.rate)
+        self._updated = time.monotonic()
+        self._changed = threading.Condition()
+
+    def _refill(self, now):
+        if self.rate <= 0:
+            self._allowance = max(self._allowance, float(self._reserved))
+        else:
+            self._allowance = min(self._allowance + (now - self._updated) * self.rate, self._reserved + self.rate)
+        self._updated = now
+
+    def reserve(self, nbytes):
+        """登记收到的字节，返回排队号"""
+        with self._changed:
+            self._refill(time.monotonic())
+            self._reserved += nbytes
+            return self._reserved
+
+    def delay(self, ticket):
+        """按当前速率，排队号为 ticket 的请求还需等待的秒数"""
+        with self._changed:
+            self._refill(time.monotonic())
+            if self._allowance >= ticket:
+                return 0.0
+            return (ticket - self._allowance) / self.rate
+
+    def acquire(self, nbytes, cancel_token=None):
+        """等待直到可以继续，返回等待的秒数；上限调整后立即按新速率重新计算"""
+        ticket = self.reserve(nbytes)
+        start = time.monotonic()
+        with self._changed:
+            while True:
+                self._refill(time.monotonic())
+                if self._allowance >= ticket:
+                    break
+                if cancel_token:
+                    cancel_token.check()
+                self._changed.wait(min((ticket - self._allowance) / self.rate, 0.1))
+        return time.monotonic() - start
+
+    def set_rate(self, rate):
+        with self._changed:
+            self._refill(time.monotonic())
+            self.rate = max(0, rate or 0)
+            self._allowance = min(self._allowance, self._reserved + self.rate)
+            self._changed.notify_all()
+
+
+class HostConnectionLimiter:
+    """限制对同一主机同时进行的请求数，limit 为 0 表示不限
+
+    上限可在运行中从任意线程调整，调低后已占用的连接不受影响，新请求等到占用数低于新上限为止。
+    """
+
+    def __init__(self, limit=0):
+        self.limit = max(0, int(limit or 0))
+        self._active = {}
+        self._changed = threading.Condition()
+
+    def _available(self, host):
+        return not self.limit or self._active.get(host, 0) < self.limit
+
+    def try_acquire(self, host):
+        """不等待，取得连接名额时返回 True"""
+        with self._changed:
+            if not self._available(host):
+                return False
+            self._active[host] = self._active.get(host, 0) + 1
+            return True
+
+    def acquire(self, host, cancel_token=None):
+        with self._changed:
+            while not self._available(host):
+                if cancel_token:
+                    cancel_token.check()
+                self._changed.wait(0.1)
+            self._active[host] = self._active.get(host, 0) + 1
+
+    def release(self, host):
+        with self._changed:
+            count = self._active.get(host, 0) - 1
+            if count > 0:
+                self._active[host] = count
+            else:
+                self._active.pop(host, None)
+            self._changed.notify_all()
+
+    def set_limit(self, limit):
+        with self._changed:
+            self.limit = max(0, int(limit or 0))
+            self._changed.notify_all()
+
+
+class ThroughputMeter:
+    """按最近 window 秒内收到的字节数计算实时吞吐量"""
+
+    def __init__(self, window=3.0):
+        self.window = window
+        self._samples = deque()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _trim(self, now):
+        while self._samples and now - self._samples[0][0] > self.window:
+            self._bytes -= self._samples.popleft()[1]
+
+    def add(self, nbytes):
+        with self._lock:
+            now = time.monotonic()
+            self._samples.append((now, nbytes))
+            self._bytes += nbytes
+            self._trim(now)
+
+    def rate(self):
+        """返回字节/秒；刚开始下载时按已经过的时间计算，避免数值偏低"""
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            if not self._samples:
+                return 0.0
+            return self._bytes / max(now - self._samples[0][0], 0.5)
+
+
+class TransferLimiter:
+    """图片下载的全局带宽上限、每主机连接数上限和实时吞吐量
+
+    带宽在每个数据块之后扣减，读取暂停时 TCP 窗口会让服务器相应放慢。
+    多个下载器、多个账号以及守护模式的多次同步可以共用一个实例；两项上限都可在下载过程中调整，0 为不限。
+    """
+
+    def __init__(self, bandwidth=0, host_connections=0):
+        self.bandwidth = BandwidthLimiter(bandwidth)
+        self.connections = HostConnectionLimiter(host_connections)
+        self.meter = ThroughputMeter()
+
+    def set_limits(self, bandwidth=None, host_connections=None):
+        """调整上限，传入 None 的项保持不变"""
+        if bandwidth is not None:
+            self.bandwidth.set_rate(bandwidth)
+        if host_connections is not None:
+            self.connections.set_limit(host_connections)
+
+    def throttle(self, nbytes, cancel_token=None):
+        """按带宽上限等待，之后计入吞吐量，返回等待的秒数
+
+        asyncio 引擎不能阻塞，直接使用 bandwidth.reserve()/delay() 等待，再调用 meter.add()。
+        """
+        waited = self.bandwidth.acquire(nbytes, cancel_token)
+        self.meter.add(nbytes)
+        return waited
+
+    def throughput(self):
+        return self.meter.rate()
+
+
+def format_rate(bytes_per_sec):
+    """把字节/秒格式化为便于阅读的速率"""
+    for unit in ('B/s', 'KB/s', 'MB/s'):
+        if bytes_per_sec < 1024:
+            return f"{bytes_per_sec:.0f} {unit}" if unit == 'B/s' else f"{bytes_per_sec:.1f} {unit}"
+        bytes_per_sec /= 1024
+    return f"{bytes_per_sec:.1f} GB/s"
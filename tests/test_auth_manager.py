@@ -0,0 +1,42 @@
+import sys
+import threading
+import types
+import unittest
+from pathlib import Path
+from unittest import mock
+
+# 项目模块都在根目录
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from auth_manager import AuthManager
+
+
+class FakeAppPixivAPI:
+    def __init__(self):
+        self.access_token = None
+        self.user_id = None
+
+    def auth(self, refresh_token=None):
+        self.access_token = 'access'
+        self.user_id = 1
+        return {'response': {'expires_in': 3600, 'user': {'name': 'tester'}}}
+
+
+class AuthManagerTest(unittest.TestCase):
+    def test_first_ensure_does_not_deadlock(self):
+        """全新的 AuthManager 第一次 ensure() 会在持有锁时创建客户端，不能死锁"""
+        fake_module = types.SimpleNamespace(AppPixivAPI=FakeAppPixivAPI)
+        manager = AuthManager('refresh', cache_path=None)
+        result = []
+        with mock.patch.dict(sys.modules, {'pixivpy3': fake_module}):
+            thread = threading.Thread(target=lambda: result.append(manager.ensure()), daemon=True)
+            thread.start()
+            thread.join(5)
+        self.assertFalse(thread.is_alive(), "ensure() 在首次登录时卡住")
+        self.assertEqual(result, [True])
+        self.assertTrue(manager.valid)
+        self.assertEqual(manager.user_name, 'tester')
+
+
+if __name__ == '__main__':
+    unittest.main()
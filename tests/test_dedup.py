@@ -0,0 +1,112 @@
+import hashlib
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+# 项目模块都在根目录
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from download_ledger import DownloadLedger
+from pixiv_downloader import PixivDownloader
+
+
+DATA = b'pixiv' * 1000
+
+
+def digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class CommitPageTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.downloader = PixivDownloader('refresh', self.root, log_func=lambda msg: None)
+
+    def tearDown(self):
+        self.downloader.close()
+        self.tmp.cleanup()
+
+    def download(self, name, data=DATA):
+        """模拟下载完成：写入 .part 临时文件后提交到 name"""
+        filepath = self.root / name
+        part = filepath.with_name(filepath.name + '.part')
+        part.write_bytes(data)
+        self.downloader._commit_page(part, filepath, len(data), hashlib.sha256(data))
+        self.assertFalse(part.exists())
+        return filepath
+
+    def test_identical_page_is_hardlinked(self):
+        first = self.download('a.jpg')
+        second = self.download('b.jpg')
+        self.assertTrue(os.path.samefile(first, second))
+        self.assertEqual(second.stat().st_nlink, 2)
+        self.assertEqual(self.downloader.metrics.counters.get('pages_deduplicated'), 1)
+        self.assertEqual(sorted(Path(p).name for p, _ in self.downloader.ledger.find_by_hash(digest(DATA))),
+                         ['a.jpg', 'b.jpg'])
+
+    def test_saved_normally_when_original_is_gone(self):
+        first = self.download('a.jpg')
+        first.unlink()
+        second = self.download('b.jpg')
+        self.assertEqual(second.read_bytes(), DATA)
+        self.assertEqual(second.stat().st_nlink, 1)
+        self.assertIsNone(self.downloader.metrics.counters.get('pages_deduplicated'))
+
+    def test_different_content_is_not_linked(self):
+        first = self.download('a.jpg')
+        second = self.download('b.jpg', DATA + b'!')
+        self.assertFalse(os.path.samefile(first, second))
+        self.assertEqual(first.read_bytes(), DATA)
+
+    def test_redownload_to_same_path_keeps_its_own_file(self):
+        first = self.download('a.jpg')
+        again = self.download('a.jpg')
+        self.assertEqual(again, first)
+        self.assertEqual(first.read_bytes(), DATA)
+        self.assertEqual(first.stat().st_nlink, 1)
+
+
+class HashIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.ledger = DownloadLedger(Path(self.tmp.name) / 'downloads.db')
+
+    def tearDown(self):
+        self.ledger.close()
+        self.tmp.cleanup()
+
+    def test_pending_hash_is_found(self):
+        self.ledger.record_hash('a.jpg', 'h1', 10)
+        self.assertEqual(self.ledger.find_by_hash('h1'), [('a.jpg', 10)])
+        self.ledger.flush()
+        self.assertEqual(self.ledger.find_by_hash('h1'), [('a.jpg', 10)])
+
+    def test_same_path_overwrites_index_entry(self):
+        self.ledger.record_hash('a.jpg', 'h1', 10)
+        self.ledger.flush()
+        # 重新下载后内容变化：提交前的记录就应覆盖数据库中的旧记录
+        self.ledger.record_hash('a.jpg', 'h2', 12)
+        self.assertEqual(self.ledger.find_by_hash('h1'), [])
+        self.assertEqual(self.ledger.find_by_hash('h2'), [('a.jpg', 12)])
+        self.ledger.flush()
+        self.assertEqual(self.ledger.find_by_hash('h1'), [])
+        self.assertEqual(self.ledger.find_by_hash('h2'), [('a.jpg', 12)])
+
+    def test_rename_paths_updates_hashes(self):
+        self.ledger.record_page(1, 0, 'old/a.jpg', 10)
+        self.ledger.record_hash('old/a.jpg', 'h1', 10)
+        self.ledger.record_hash('old/b.jpg', 'h2', 20)
+        # 目标路径已有旧的哈希记录时以移动过来的文件为准
+        self.ledger.record_hash('new/b.jpg', 'stale', 5)
+        self.ledger.rename_paths({'old/a.jpg': 'new/a.jpg', 'old/b.jpg': 'new/b.jpg'})
+        self.assertEqual(self.ledger.find_by_hash('h1'), [('new/a.jpg', 10)])
+        self.assertEqual(self.ledger.find_by_hash('h2'), [('new/b.jpg', 20)])
+        self.assertEqual(self.ledger.find_by_hash('stale'), [])
+        self.assertEqual(self.ledger.get_page(1, 0), ('new/a.jpg', 10))
+
+
+if __name__ == '__main__':
+    unittest.main()
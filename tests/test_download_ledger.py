@@ -0,0 +1,108 @@
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+# 项目模块都在根目录
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from download_ledger import DownloadLedger
+
+
+class DownloadLedgerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.ledger = DownloadLedger(self.root / 'downloads.db', batch_size=50)
+
+    def tearDown(self):
+        self.ledger.close()
+        self.tmp.cleanup()
+
+    def test_migrate_text_ledger(self):
+        text = self.root / 'downloaded_ids.txt'
+        # 旧文件的最后一行可能只写了一半
+        text.write_text("101\n102\n\n 103 \n10", encoding='utf-8')
+        self.assertEqual(self.ledger.migrate_text_ledger(text), 4)
+        self.assertFalse(text.exists())
+        self.assertTrue((self.root / 'downloaded_ids.txt.migrated').exists())
+        for illust_id in (101, 102, 103, 10):
+            self.assertIn(illust_id, self.ledger)
+        self.assertEqual(len(self.ledger), 4)
+
+    def test_migrate_twice(self):
+        """第二次运行时文本文件已改名，不会重复导入；重新出现的旧文件也不会覆盖已有记录"""
+        text = self.root / 'downloaded_ids.txt'
+        text.write_text("101\n102\n", encoding='utf-8')
+        self.ledger.record(101, user_name='artist', title='title', pages=2)
+        self.assertEqual(self.ledger.migrate_text_ledger(text), 2)
+        self.assertEqual(self.ledger.migrate_text_ledger(text), 0)
+        text.write_text("102\n", encoding='utf-8')
+        self.assertEqual(self.ledger.migrate_text_ledger(text), 1)
+        self.assertEqual(len(self.ledger), 2)
+        self.assertEqual(self.ledger.get(101)['title'], 'title')
+
+    def test_concurrent_claim(self):
+        """多个线程同时登记同一作品，只有一个成功"""
+        results = []
+        barrier = threading.Barrier(8)
+
+        def claim():
+            barrier.wait()
+            results.append(self.ledger.claim(7))
+
+        threads = [threading.Thread(target=claim) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(results), [False] * 7 + [True])
+
+    def test_release_and_record_end_claim(self):
+        self.assertTrue(self.ledger.claim(7))
+        self.assertFalse(self.ledger.claim(7))
+        self.ledger.release(7)
+        self.assertTrue(self.ledger.claim(7))
+        # 下载完成后不能再登记，尚未提交的记录同样有效
+        self.ledger.record(7)
+        self.assertFalse(self.ledger.claim(7))
+        self.ledger.flush()
+        self.assertFalse(self.ledger.claim(7))
+
+    def test_failure_ends_claim(self):
+        self.assertTrue(self.ledger.claim(8))
+        self.ledger.record_failure({'id': 8}, 'timeout')
+        self.assertTrue(self.ledger.claim(8))
+
+    def test_pending_records_are_visible(self):
+        self.ledger.record(1, pages=1)
+        self.ledger.record_page(2, 0, 'a.jpg', 10)
+        self.assertIn(1, self.ledger)
+        self.assertNotIn(2, self.ledger)
+        self.assertEqual(self.ledger.get_page(2, 0), ('a.jpg', 10))
+        self.assertIsNone(self.ledger.get_page(2, 1))
+        # 尚未提交时数据库中还没有这些记录
+        count = self.ledger._conn.execute("SELECT COUNT(*) FROM illusts").fetchone()[0]
+        self.assertEqual(count, 0)
+        self.ledger.flush()
+        self.assertIn(1, self.ledger)
+        self.assertEqual(self.ledger.get_page(2, 0), ('a.jpg', 10))
+
+    def test_batch_flushes_automatically(self):
+        for illust_id in range(50):
+            self.ledger.record(illust_id)
+        count = self.ledger._conn.execute("SELECT COUNT(*) FROM illusts").fetchone()[0]
+        self.assertEqual(count, 50)
+
+    def test_records_survive_reopen(self):
+        self.ledger.record(5)
+        self.ledger.record_page(5, 0, 'a.jpg', 10)
+        self.ledger.close()
+        self.ledger = DownloadLedger(self.root / 'downloads.db')
+        self.assertIn(5, self.ledger)
+        self.assertEqual(self.ledger.get_page(5, 0), ('a.jpg', 10))
+
+
+if __name__ == '__main__':
+    unittest.main()
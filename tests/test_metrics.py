@@ -0,0 +1,43 @@
+import sys
+import unittest
+from pathlib import Path
+
+# 项目模块都在根目录
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from metrics import Metrics
+
+
+class MetricsSummaryTest(unittest.TestCase):
+    def test_summary_since_snapshot(self):
+        """共用的统计只汇总本次运行新增的部分，Prometheus 输出仍然累加"""
+        metrics = Metrics()
+        metrics.inc('pages_downloaded', 5)
+        metrics.inc('illusts_failed')
+        metrics.observe('transfer', 1.0)
+        metrics.observe('auth', 0.5)
+
+        start = metrics.snapshot()
+        metrics.inc('pages_downloaded', 2)
+        metrics.observe('transfer', 0.25)
+
+        lines = metrics.summary_lines(start)
+        self.assertEqual(len(lines), 3)
+        self.assertIn("数据传输: 1 次, 总计 0.25s", lines[1])
+        self.assertEqual(lines[2], "计数: pages_downloaded=2")
+
+        full = metrics.summary_lines()
+        self.assertIn("数据传输: 2 次, 总计 1.25s", full[1])
+        self.assertIn("pages_downloaded=7", full[-1])
+        self.assertIn("quickpixiv_pages_downloaded_total 7", metrics.prometheus_text())
+
+    def test_snapshot_is_a_copy(self):
+        metrics = Metrics()
+        metrics.observe('transfer', 1.0)
+        start = metrics.snapshot()
+        metrics.observe('transfer', 1.0)
+        self.assertEqual(start[1]['transfer'].count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import sys
+import tempfile
+import types
+import unittest
+from pathlib import Path
+
+# 项目模块都在根目录
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pixiv_downloader import PixivDownloader
+
+
+def make_illust(illust_id, bookmarks=100, illust_type='illust'):
+    return {'id': illust_id, 'type': illust_type, 'total_bookmarks': bookmarks, 'create_date': '2024-01-01'}
+
+
+class WatermarkTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.downloader = PixivDownloader('refresh', self.tmp.name, min_bookmarks=50, illust_types=['illust'],
+                                          log_func=lambda msg: None)
+        self.downloader.auth._api = types.SimpleNamespace(user_id=5)
+
+    def tearDown(self):
+        self.downloader.close()
+        self.tmp.cleanup()
+
+    def advance(self, illusts):
+        self.downloader._watermark_candidates.append((7, illusts))
+        self.downloader._advance_watermarks()
+        return self.downloader.ledger.get_watermark(5, 7, self.downloader.filter.fingerprint)
+
+    def test_unprocessed_illust_blocks_newer_ones(self):
+        """中途停止时未处理的作品之后的部分不推进水位线"""
+        ledger = self.downloader.ledger
+        ledger.record(3)
+        ledger.record(1)
+        ledger.record_failure(make_illust(2), 'timeout')
+        self.assertEqual(self.advance([make_illust(4), make_illust(3), make_illust(2), make_illust(1)])[0], 3)
+
+    def test_nothing_processed_keeps_watermark(self):
+        self.assertIsNone(self.advance([make_illust(2), make_illust(1)]))
+
+    def test_only_permanent_rejections_count(self):
+        """类型不符的作品不再检查，收藏数不足的作品以后可能满足条件"""
+        illusts = [make_illust(3), make_illust(2, bookmarks=10), make_illust(1, illust_type='manga')]
+        for illust in illusts[1:]:
+            self.assertFalse(self.downloader._should_download(illust))
+        self.assertEqual(self.advance(illusts)[0], 1)
+
+    def test_accounts_have_separate_watermarks(self):
+        """多个账号共用下载记录时，一个账号的水位线不影响另一个账号"""
+        self.downloader.ledger.record(1)
+        self.assertEqual(self.advance([make_illust(1)])[0], 1)
+        self.assertIsNone(self.downloader.ledger.get_watermark(6, 7, self.downloader.filter.fingerprint))
+
+    def test_changed_filters_invalidate_watermark(self):
+        """放宽类型条件后，之前因类型被排除的作品需要重新检查"""
+        illusts = [make_illust(2), make_illust(1, illust_type='manga')]
+        self.downloader.ledger.record(2)
+        self.assertFalse(self.downloader._should_download(illusts[1]))
+        self.assertEqual(self.advance(illusts)[0], 2)
+
+        self.downloader.illust_types = ['illust', 'manga']
+        self.downloader._compile_filter()
+        self.assertIsNone(self.downloader.ledger.get_watermark(5, 7, self.downloader.filter.fingerprint))
+        self.assertTrue(self.downloader._should_download(illusts[1]))
+
+    def test_threshold_changes_keep_watermark(self):
+        """收藏数和浏览数条件不影响水位线"""
+        before = self.downloader.filter.fingerprint
+        self.downloader.min_bookmarks = 1000
+        self.downloader._compile_filter()
+        self.assertEqual(self.downloader.filter.fingerprint, before)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,7 @@
 import subprocess
 import sys
 import re
-from pixivpy3 import *
+from auth_manager import get_auth_manager, is_auth_error
 
 def get_token_interactive():
     """调用gppt交互式获取refresh_token"""
@@ -38,21 +38,23 @@ def refresh_token(old_token):
         return None, str(e)
 
 def verify_token(token):
-    """验证token是否有效"""
+    """验证token是否有效
+    
+    与下载器共用同一个登录状态：刚刚用 refresh_token 登录成功即说明有效；
+    使用缓存的 access_token 时请求一次用户信息确认，失效则重新登录。
+    """
     try:
-        # 创建API实例
-        api = AppPixivAPI()
-        
-        # 尝试使用token登录
-        result = api.auth(refresh_token=token)
-        
-        if result:
-            # 获取用户信息来验证token
-            user_info = api.user_detail(api.user_id)
-            username = user_info.user.name
-            return token, f"Token验证成功！用户名: {username}"
-        else:
-            return None, "Token验证失败：登录失败"
+        auth = get_auth_manager(token)
+        if not auth.ensure():
+            user_info = auth.api.user_detail(auth.api.user_id)
+            if is_auth_error(user_info.get('error')):
+                auth.invalidate()
+                auth.ensure()
+            elif user_info.get('error'):
+                return None, f"Token验证失败：{user_info['error'].get('message')}"
+            else:
+                auth.user_name = user_info['user']['name']
+        return token, f"Token验证成功！用户名: {auth.user_name}"
             
     except Exception as e:
         return None, f"Token验证失败：{str(e)}" 
\ No newline at end of file